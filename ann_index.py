@@ -0,0 +1,173 @@
+import argparse
+import math
+import time
+
+import numpy as np
+
+import config
+
+ASSIGN_CHUNK_ROWS = 8192
+
+
+def _unit_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def default_nlist(row_count):
+    """Picks the number of inverted lists: about 4 * sqrt(n), with at least ~39 rows per list."""
+    if config.ANN_NLIST:
+        return max(1, min(config.ANN_NLIST, row_count))
+    return max(1, min(int(4 * math.sqrt(row_count)), row_count // 39))
+
+
+def assign(rows, centroids):
+    """Returns the index of the closest (highest cosine) centroid for every row."""
+    labels = np.empty(len(rows), dtype=np.int32)
+    for start in range(0, len(rows), ASSIGN_CHUNK_ROWS):
+        chunk = np.asarray(rows[start:start + ASSIGN_CHUNK_ROWS], dtype=np.float32)
+        labels[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+def train_centroids(sample, nlist, iterations=None, seed=0):
+    """Runs spherical k-means on unit-length rows and returns unit-length centroids."""
+    iterations = iterations or config.ANN_KMEANS_ITERATIONS
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(sample, dtype=np.float32)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(sample, centroids)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=nlist)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        filled = counts > 0
+        sums = np.zeros_like(centroids)
+        sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+        # Re-seed empty lists from random rows so every list stays in use
+        sums[~filled] = sample[rng.choice(len(sample), int((~filled).sum()))]
+        centroids = _unit_rows(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over rows stored contiguously by list.
+
+    ``offsets[i]:offsets[i + 1]`` is the row range of list ``i``, so probing a
+    list reads one contiguous slice of the (memory-mapped) matrix.
+    """
+
+    def __init__(self, centroids, offsets):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, rows, seed=0):
+        """Trains centroids on ``rows`` and returns ``(index, order)``.
+
+        ``order`` lists the row numbers grouped by inverted list; the caller
+        must store the rows in that order for the offsets to be valid.
+        """
+        rows = np.asarray(rows, dtype=np.float32) if not isinstance(rows, np.ndarray) else rows
+        nlist = default_nlist(len(rows))
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(rows), max(config.ANN_TRAIN_SAMPLE, nlist))
+        sample_rows = np.sort(rng.choice(len(rows), sample_size, replace=False))
+        centroids = train_centroids(rows[sample_rows], nlist, seed=seed)
+        labels = assign(rows, centroids)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=nlist))])
+        return cls(centroids, offsets), order
+
+    def probe(self, query, nprobe=None):
+        """Returns the ``(start, stop)`` row ranges of the lists closest to ``query``."""
+        nprobe = max(1, min(nprobe or config.ANN_NPROBE, self.nlist))
+        scores = self.centroids @ query
+        closest = np.argpartition(-scores, nprobe - 1)[:nprobe]
+        return [(int(self.offsets[i]), int(self.offsets[i + 1])) for i in np.sort(closest)]
+
+    def search(self, matrix, query, k, nprobe=None):
+        """Returns ``(rows, scores)`` of the approximate top ``k`` rows of ``matrix``."""
+        rows, scores = [], []
+        for start, stop in self.probe(query, nprobe):
+            if stop > start:
+                rows.append(np.arange(start, stop))
+                scores.append(np.asarray(matrix[start:stop]) @ query)
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return rows[top], scores[top]
+
+    def save(self, path):
+        with open(path, "wb") as handle:
+            np.savez(handle, centroids=self.centroids, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["centroids"], data["offsets"])
+
+
+def recall_at_k(matrix, ivf, queries, k=10, nprobe=None):
+    """Measures recall@k of IVF search against exact search, and mean latencies in ms."""
+    hits, exact_seconds, ann_seconds = 0, 0.0, 0.0
+    for query in queries:
+        started = time.perf_counter()
+        exact_scores = np.asarray(matrix) @ query
+        exact = set(np.argpartition(-exact_scores, k - 1)[:k].tolist())
+        exact_seconds += time.perf_counter() - started
+
+        started = time.perf_counter()
+        rows, _ = ivf.search(matrix, query, k, nprobe)
+        ann_seconds += time.perf_counter() - started
+        hits += len(exact & set(rows.tolist()))
+    count = len(queries)
+    return {
+        "recall": hits / (k * count),
+        "exact_ms": 1000 * exact_seconds / count,
+        "ann_ms": 1000 * ann_seconds / count,
+    }
+
+
+def _synthetic_rows(rows, dim, clusters, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    return _unit_rows(centers[labels] + 0.6 * rng.normal(size=(rows, dim)).astype(np.float32))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latency benchmark of IVF search against exact search.")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    data = _synthetic_rows(args.rows + args.queries, args.dim, args.clusters, args.seed)
+    matrix, queries = data[:args.rows], data[args.rows:]
+    started = time.perf_counter()
+    ivf, order = IVFIndex.build(matrix, seed=args.seed)
+    matrix = matrix[order]
+    print(f"built {ivf.nlist} lists over {args.rows} rows in {time.perf_counter() - started:.2f}s")
+    for nprobe in args.nprobe:
+        result = recall_at_k(matrix, ivf, queries, args.k, nprobe)
+        print(
+            f"nprobe={nprobe:<4} recall@{args.k}={result['recall']:.3f}"
+            f"  exact={result['exact_ms']:.2f}ms  ivf={result['ann_ms']:.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
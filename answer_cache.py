@@ -0,0 +1,164 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+import config
+from bm25_index import tokenize
+from embedding_cache import normalize_text
+from tracing import record_cache
+
+CacheHit = namedtuple("CacheHit", ["answer", "tier", "similarity", "sources"], defaults=((),))
+
+_shared_cache = None
+_shared_scheduler = None
+_shared_lock = threading.Lock()
+
+
+def normalize_question(question):
+    """Lower-cases and collapses whitespace and trailing punctuation for exact matching."""
+    return normalize_text(question).lower().rstrip(" ?!.")
+
+
+def identifier_tokens(question):
+    """Returns the question's tokens that contain a digit: numbers, part numbers, clause IDs."""
+    return frozenset(token for token in tokenize(question) if any(char.isdigit() for char in token))
+
+
+class AnswerCache:
+    """Two-tier answer cache with TTL and LRU eviction, scoped per corpus.
+
+    The exact tier matches normalised question text. The semantic tier
+    reuses an answer when the cosine similarity between query embeddings
+    reaches ``similarity`` and both questions name the same numbers and
+    identifiers, since embeddings barely tell "part A-113" from "part
+    A-114". Entries expire after ``ttl_seconds`` and the
+    least recently used ones are dropped past ``max_entries``.
+    """
+
+    def __init__(self, max_entries=None, ttl_seconds=None, similarity=None, clock=time.time):
+        self.max_entries = max_entries or config.ANSWER_CACHE_MAX_ENTRIES
+        self.ttl_seconds = config.ANSWER_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.similarity = config.ANSWER_CACHE_SIMILARITY if similarity is None else similarity
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (corpus_key, normalised question) -> entry dict
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds > 0 and now - entry["created"] > self.ttl_seconds
+
+    def lookup(self, corpus_key, question, embedding=None):
+        """Returns a CacheHit for ``question`` within ``corpus_key``, or None."""
+        now = self._clock()
+        exact_key = (corpus_key, normalize_question(question))
+        with self._lock:
+            entry = self._entries.get(exact_key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[exact_key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(exact_key)
+                self.hits["exact"] += 1
+                return CacheHit(entry["answer"], "exact", 1.0, entry["sources"])
+
+            if embedding is not None and self.similarity <= 1.0:
+                hit = self._semantic_lookup(corpus_key, _unit(embedding), identifier_tokens(question), now)
+                if hit is not None:
+                    return hit
+            self.misses += 1
+            return None
+
+    def _semantic_lookup(self, corpus_key, query, identifiers, now):
+        keys, vectors = [], []
+        for key, entry in list(self._entries.items()):
+            if key[0] != corpus_key or entry["embedding"] is None:
+                continue
+            if self._expired(entry, now):
+                del self._entries[key]
+                continue
+            if entry["embedding"].shape == query.shape and entry["identifiers"] == identifiers:
+                keys.append(key)
+                vectors.append(entry["embedding"])
+        if not vectors:
+            return None
+        similarities = np.stack(vectors) @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity:
+            return None
+        self._entries.move_to_end(keys[best])
+        self.hits["semantic"] += 1
+        entry = self._entries[keys[best]]
+        return CacheHit(entry["answer"], "semantic", float(similarities[best]), entry["sources"])
+
+    def store(self, corpus_key, question, answer, embedding=None, sources=()):
+        """Caches an answer for ``question`` within ``corpus_key``, with the sources it came from."""
+        exact_key = (corpus_key, normalize_question(question))
+        with self._lock:
+            self._entries[exact_key] = {
+                "answer": answer,
+                "sources": tuple(sources),
+                "identifiers": identifier_tokens(question),
+                "embedding": None if embedding is None else _unit(embedding),
+                "created": self._clock(),
+            }
+            self._entries.move_to_end(exact_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def _unit(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def shared_answer_cache():
+    """Returns the process-wide answer cache, shared by every session."""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = AnswerCache()
+        return _shared_cache
+
+
+def embed_question(question):
+    """Embeds a question with the configured embedder (through the embedding cache)."""
+    global _shared_scheduler
+    from embeddings import build_scheduler
+
+    with _shared_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = build_scheduler()
+    return _shared_scheduler.embed([question])[0]
+
+
+def cached_answer(corpus_key, question, answer_fn, bypass=False, sources=None):
+    """Answers ``question`` from the cache, or with ``answer_fn`` and caches the result.
+
+    Returns ``(answer, hit)`` where ``hit`` is the CacheHit or None on a
+    miss. With ``bypass`` the cache is neither read nor written. ``sources``
+    is a list ``answer_fn`` fills with source labels; they are cached with
+    the answer and put back into the list on a hit.
+    """
+    if bypass or corpus_key is None:
+        record_cache("answer", "bypass")
+        return answer_fn(question), None
+    cache = shared_answer_cache()
+    embedding = None
+    if cache.similarity <= 1.0:
+        try:
+            embedding = embed_question(question)
+        except Exception:
+            pass  # Fall back to the exact tier if the embedder is unavailable
+    hit = cache.lookup(corpus_key, question, embedding)
+    record_cache("answer", hit.tier if hit else "miss")
+    if hit is not None:
+        if sources is not None:
+            sources.extend(hit.sources)
+        return hit.answer, hit
+    answer = answer_fn(question)
+    cache.store(corpus_key, question, answer, embedding, sources or ())
+    return answer, None
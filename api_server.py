@@ -0,0 +1,496 @@
+import argparse
+import base64
+import binascii
+import io
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import config
+from answer_cache import cached_answer
+from batch_qa import source_labels
+from chat_memory import remember_turn
+from hybrid_retrieval import build_chat_engine, build_query_engine
+from index_cache import build_service_context, cache_dir, corpus_key, load_cached_index
+from index_registry import LEASE_KEY, session_index, shared_registry
+from ingest_jobs import CANCELLED, DONE, FAILED, shared_jobs
+from tracing import shared_tracer, span
+from warmup import shared_resource, shared_warmup, start_warmup
+
+STATUS_PATH = re.compile(r"^/ingest/([0-9a-f]{64})$")
+NDJSON = "application/x-ndjson"
+
+logger = logging.getLogger(__name__)
+
+
+class ApiError(Exception):
+    """A request failure with the HTTP status to answer it with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def build_llm():
+    if config.API_LLM == "mock":
+        from llama_index.core.llms import MockLLM
+
+        return MockLLM()
+    from llama_index.llms.openai import OpenAI
+
+    return OpenAI(model=config.API_LLM_MODEL, temperature=0.1, system_prompt=config.API_SYSTEM_PROMPT)
+
+
+def build_api_service_context():
+    return build_service_context(build_llm())
+
+
+def job_status(job):
+    return {
+        "corpus_key": job.key,
+        "status": job.status,
+        "stage": job.stage,
+        "files_done": job.files_done,
+        "files_total": job.files_total,
+        "pages": job.pages,
+        "chunks": job.chunks,
+        "error": job.error,
+    }
+
+
+def decode_files(items):
+    """Turns ``[{"name": ..., "content": <base64>}, ...]`` into named in-memory files."""
+    if not isinstance(items, list) or not items:
+        raise ApiError(400, "files must be a non-empty list of {name, content} objects")
+    files = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get("name") or not item.get("content"):
+            raise ApiError(400, "each file needs a name and base64 content")
+        try:
+            buffer = io.BytesIO(base64.b64decode(item["content"], validate=True))
+        except (binascii.Error, TypeError, ValueError):
+            raise ApiError(400, f"{item['name']}: content is not valid base64")
+        buffer.name = str(item["name"])
+        files.append(buffer)
+    return files
+
+
+def _relay(tokens, on_token, current):
+    # Hands each streamed token to the caller and returns the full text; records time to first token
+    started = time.perf_counter()
+    parts = []
+    for token in tokens:
+        if not parts and current is not None:
+            current.set(first_token_ms=round((time.perf_counter() - started) * 1000, 3))
+        parts.append(token)
+        on_token(token)
+    return "".join(parts)
+
+
+class ChatSession:
+    """One API chat conversation: its engine, its index lease and a lock serialising its turns."""
+
+    def __init__(self, session_id, key):
+        self.id = session_id
+        self.key = key
+        self.store = {}  # Holds the index lease, as st.session_state does in the apps
+        self.chat_engine = None
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+
+    def close(self):
+        lease = self.store.pop(LEASE_KEY, None)
+        if lease is not None:
+            lease.release()
+
+
+class SessionStore:
+    """Chat sessions by ID, dropped after ``ttl`` idle seconds or beyond ``max_sessions``."""
+
+    def __init__(self, ttl=None, max_sessions=None):
+        self.ttl = config.API_SESSION_TTL_SECONDS if ttl is None else ttl
+        self.max_sessions = max_sessions or config.API_MAX_SESSIONS
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # session ID -> ChatSession, least recently used first
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def get(self, session_id):
+        with self._lock:
+            self._prune()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.time()
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def add(self, session):
+        with self._lock:
+            self._sessions[session.id] = session
+            self._prune()
+
+    def drop(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+        return session is not None
+
+    def _prune(self):
+        # Called with the lock held; sessions mid-turn are skipped
+        cutoff = time.time() - self.ttl
+        for session_id, session in list(self._sessions.items()):
+            expired = session.last_used < cutoff or len(self._sessions) > self.max_sessions
+            if not expired:
+                continue
+            if session.lock.acquire(blocking=False):
+                del self._sessions[session_id]
+                session.close()
+                session.lock.release()
+
+
+class RagApi:
+    """Ingest, query and chat over cached indexes, independent of any HTTP transport.
+
+    Builds run on the shared ingestion job pool and indexes are leased from
+    the shared registry, so the API and the Streamlit apps in one process
+    reuse each other's work. ``on_token`` callbacks receive streamed answer
+    text as it is generated.
+    """
+
+    def __init__(self, service_context=None, sessions=None):
+        self._service_context = service_context
+        self.sessions = sessions or SessionStore()
+
+    @property
+    def service_context(self):
+        if self._service_context is None:
+            return shared_resource("api_service_context", build_api_service_context)
+        return self._service_context
+
+    def ingest(self, files, base_key=None, retry=False):
+        """Starts indexing ``files`` and returns the corpus key with the job status."""
+        key = corpus_key(files)
+        if (cache_dir(key) / "docstore.json").exists() and shared_jobs().get(key) is None:
+            return {"corpus_key": key, "status": DONE, "cached": True}
+        job = shared_jobs().submit(key, files, self.service_context, base_key=base_key, retry=retry)
+        return dict(job_status(job), cached=False)
+
+    def status(self, key):
+        job = shared_jobs().get(key)
+        if job is not None:
+            return job_status(job)
+        if shared_registry().contains(key) or (cache_dir(key) / "docstore.json").exists():
+            return {"corpus_key": key, "status": DONE}
+        raise ApiError(404, f"unknown corpus {key}")
+
+    def cancel(self, key):
+        job = shared_jobs().get(key)
+        if job is None:
+            raise ApiError(404, f"no ingestion job for {key}")
+        job.cancel()
+        return job_status(job)
+
+    def _build(self, key):
+        """Returns the index builder for ``key``, taking over a finished job's index if there is one."""
+        jobs = shared_jobs()
+        job = jobs.get(key)
+        if job is not None and not job.finished:
+            raise ApiError(409, f"{key} is still being indexed ({job.stage})")
+        if job is not None and job.status in (FAILED, CANCELLED):
+            raise ApiError(409, f"indexing {key} {job.status}: {job.error}")
+
+        def build():
+            if job is not None and job.status == DONE:
+                jobs.forget(job)
+                return job.result()
+            index = load_cached_index(key, self.service_context)
+            if index is None:
+                raise ApiError(404, f"unknown corpus {key}")
+            return index
+
+        return build
+
+    def query(self, key, question, on_token=None, bypass_cache=False):
+        """Answers a one-off question over corpus ``key``."""
+        lease = shared_registry().lease(key, self._build(key))
+        sources = []
+
+        def generate(text):
+            with span("query", streaming=on_token is not None) as current:
+                response = build_query_engine(lease.index, key, streaming=on_token is not None).query(text)
+                sources.extend(source_labels(response))
+                if on_token is None:
+                    return response.response
+                return _relay(response.response_gen, on_token, current)
+
+        try:
+            with span("api_query"):
+                answer, hit = cached_answer(key, question, generate, bypass_cache, sources)
+        finally:
+            lease.release()
+        if hit is not None and on_token is not None:
+            on_token(answer)
+        return {"corpus_key": key, "answer": answer, "sources": sources, "cache": hit.tier if hit else None}
+
+    def session(self, session_id, key):
+        """Returns chat session ``session_id``, starting it over corpus ``key`` if it does not exist."""
+        session = self.sessions.get(session_id) if session_id else None
+        if session is not None:
+            if key and key != session.key:
+                raise ApiError(409, f"session {session_id} is bound to corpus {session.key}")
+            return session
+        if not key and session_id:
+            raise ApiError(404, f"unknown session {session_id}; pass corpus_key to start a new one")
+        if not key:
+            raise ApiError(400, "corpus_key is required to start a chat session")
+        session = ChatSession(session_id or uuid.uuid4().hex, key)
+        index = session_index(session.store, key, self._build(key))
+        session.chat_engine = build_chat_engine(index, key)
+        self.sessions.add(session)
+        return session
+
+    def chat(self, session_id, message, key=None, on_token=None, bypass_cache=False):
+        """Answers ``message`` in a chat session, starting one over ``key`` if needed."""
+        session = self.session(session_id, key)
+        if not session.lock.acquire(blocking=False):
+            raise ApiError(409, f"session {session.id} is already answering a message")
+        try:
+            chat_engine = session.chat_engine
+            sources = []
+
+            def generate(text):
+                with span("chat", streaming=on_token is not None) as current:
+                    if on_token is None:
+                        response = chat_engine.chat(text)
+                        sources.extend(source_labels(response))
+                        return response.response
+                    response = chat_engine.stream_chat(text)
+                    sources.extend(source_labels(response))
+                    return _relay(response.response_gen, on_token, current)
+
+            # Follow-ups depend on the conversation, so only opening questions use the cache
+            bypass = bypass_cache or bool(chat_engine.chat_history)
+            with span("api_chat"):
+                answer, hit = cached_answer(session.key, message, generate, bypass, sources)
+            if hit is not None:
+                remember_turn(chat_engine, message, answer)
+                if on_token is not None:
+                    on_token(answer)
+        finally:
+            session.last_used = time.time()
+            session.lock.release()
+        return {
+            "session_id": session.id,
+            "corpus_key": session.key,
+            "answer": answer,
+            "sources": sources,
+            "cache": hit.tier if hit else None,
+        }
+
+    def end_chat(self, session_id):
+        if not self.sessions.drop(session_id):
+            raise ApiError(404, f"unknown session {session_id}")
+        return {"session_id": session_id, "status": "closed"}
+
+    def health(self):
+        warmup = shared_warmup()
+        return {
+            "status": "ok",
+            "warm": warmup is None or warmup.done.is_set(),
+            "sessions": len(self.sessions),
+            "indexes": shared_registry().stats(),
+        }
+
+
+class ApiServer(ThreadingHTTPServer):
+    """Thread-per-connection server with a cap on requests doing real work at once."""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, api, max_concurrent=None):
+        super().__init__(address, ApiHandler)
+        self.api = api
+        self.slots = threading.BoundedSemaphore(max_concurrent or config.API_MAX_CONCURRENT)
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """JSON endpoints over RagApi; ``"stream": true`` answers as newline-delimited JSON."""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive and chunked streaming
+
+    def log_message(self, format, *args):
+        logger.info("%s %s", self.address_string(), format % args)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        self._handle(lambda: self._route_get(path), limited=False)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        self._handle(lambda: self._route_post(path), limited=True)
+
+    def do_DELETE(self):
+        path = urlparse(self.path).path
+        self._handle(lambda: self._route_delete(path), limited=False)
+
+    def _route_get(self, path):
+        api = self.server.api
+        if path == "/healthz":
+            return self._send_json(200, api.health())
+        if path == "/metrics":
+            return self._send(200, shared_tracer().render_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+        match = STATUS_PATH.match(path)
+        if match:
+            return self._send_json(200, api.status(match.group(1)))
+        raise ApiError(404, f"no route for GET {path}")
+
+    def _route_post(self, path):
+        api = self.server.api
+        body = self._read_json()
+        if path == "/ingest":
+            result = api.ingest(decode_files(body.get("files")), body.get("base_key"), bool(body.get("retry")))
+            return self._send_json(200 if result["status"] == DONE else 202, result)
+        if path == "/query":
+            key, question = self._require(body, "corpus_key"), self._require(body, "question")
+            bypass = bool(body.get("bypass_cache"))
+            if body.get("stream"):
+                return self._stream(lambda on_token: api.query(key, question, on_token, bypass))
+            return self._send_json(200, api.query(key, question, bypass_cache=bypass))
+        if path == "/chat":
+            message = self._require(body, "message")
+            session_id, key, bypass = body.get("session_id"), body.get("corpus_key"), bool(body.get("bypass_cache"))
+            if body.get("stream"):
+                # Session errors are raised before the 200 goes out
+                session_id = api.session(session_id, key).id
+                return self._stream(lambda on_token: api.chat(session_id, message, key, on_token, bypass))
+            return self._send_json(200, api.chat(session_id, message, key, bypass_cache=bypass))
+        raise ApiError(404, f"no route for POST {path}")
+
+    def _route_delete(self, path):
+        api = self.server.api
+        match = STATUS_PATH.match(path)
+        if match:
+            return self._send_json(200, api.cancel(match.group(1)))
+        if path.startswith("/chat/"):
+            return self._send_json(200, api.end_chat(path[len("/chat/"):]))
+        raise ApiError(404, f"no route for DELETE {path}")
+
+    def _handle(self, route, limited):
+        slots = self.server.slots if limited else None
+        if slots is not None and not slots.acquire(timeout=config.API_QUEUE_TIMEOUT_SECONDS):
+            self.close_connection = True  # The unread body would be parsed as the next request
+            self._send_json(503, {"error": "server busy, try again later"}, {"Retry-After": "1"})
+            return
+        try:
+            route()
+        except ApiError as e:
+            self._send_json(e.status, {"error": e.message})
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # Client went away mid-answer
+        except Exception as e:
+            logger.exception("Request %s %s failed", self.command, self.path)
+            self._send_json(500, {"error": str(e)})
+        finally:
+            if slots is not None:
+                slots.release()
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > config.API_MAX_UPLOAD_MB * 1024 * 1024:
+            self.close_connection = True  # The unread body would be parsed as the next request
+            raise ApiError(413, f"request body over {config.API_MAX_UPLOAD_MB:g} MB")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise ApiError(400, "request body is not valid JSON")
+        if not isinstance(body, dict):
+            raise ApiError(400, "request body must be a JSON object")
+        return body
+
+    @staticmethod
+    def _require(body, field):
+        value = body.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ApiError(400, f"{field} is required")
+        return value
+
+    def _send(self, status, payload, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_json(self, status, body, headers=None):
+        self._send(status, json.dumps(body).encode("utf-8"), "application/json", headers)
+
+    def _write_chunk(self, body):
+        data = (json.dumps(body) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, answer):
+        """Sends ``{"token": ...}`` lines as ``answer(on_token)`` produces them, then its result with ``"done": true``."""
+        self.send_response(200)
+        self.send_header("Content-Type", NDJSON)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            result = answer(lambda token: self._write_chunk({"token": token}))
+            self._write_chunk(dict(result, done=True))
+        except (BrokenPipeError, ConnectionResetError):
+            raise
+        except Exception as e:
+            # The status line is already sent, so errors travel in the stream
+            if not isinstance(e, ApiError):
+                logger.exception("Streaming %s failed", self.path)
+            self._write_chunk({"error": getattr(e, "message", str(e)), "done": True})
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def make_server(api=None, host=None, port=None, max_concurrent=None):
+    """Returns an ApiServer bound to ``host:port``; call ``serve_forever`` to run it."""
+    host = config.API_HOST if host is None else host
+    port = config.API_PORT if port is None else port
+    return ApiServer((host, port), api or RagApi(), max_concurrent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve ingest, query and chat over HTTP.")
+    parser.add_argument("--host", default=config.API_HOST)
+    parser.add_argument("--port", type=int, default=config.API_PORT)
+    parser.add_argument("--max-concurrent", type=int, default=None, help="requests served at once")
+    parser.add_argument("--stub-llm", action="store_true", help="answer with MockLLM, for tests")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.stub_llm:
+        config.API_LLM = "mock"
+
+    start_warmup({"api_service_context": build_api_service_context})
+    server = make_server(host=args.host, port=args.port, max_concurrent=args.max_concurrent)
+    print(f"Serving on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 import streamlit as st
-import pdfplumber
+from extraction import extract_pages
+from embeddings import build_scheduler
+from batch_qa import map_ordered
 import os
 import tempfile
 import openai
@@ -9,33 +11,27 @@ from llama_index.core import VectorStoreIndex, ServiceContext, Document, SimpleD
 # Set your OpenAI API key
 openai.api_key = st.secrets.openai_key
 
-# Initialize your LlamaIndex
-index = VectorStoreIndex("OpenAI")
-
 def extract_text_from_pdf(file):
     """Extracts text from a PDF file."""
-    with pdfplumber.open(file) as pdf:
-        pages = [page.extract_text() for page in pdf.pages]
-    return "\n".join(filter(None, pages))
+    pages = extract_pages([file])[0]
+    return "\n".join(filter(None, (text for _, text in pages)))
 
 def process_pdf_files(uploaded_files):
-    """Process each uploaded PDF file and extract text."""
+    """Process each uploaded PDF file and extract text, pages in parallel."""
+    pdf_files = [uploaded_file for uploaded_file in uploaded_files if uploaded_file.type == "application/pdf"]
     all_texts = []
-    for uploaded_file in uploaded_files:
-        if uploaded_file.type == "application/pdf":
-            text = extract_text_from_pdf(uploaded_file)
-            all_texts.append(text)
+    for pages in extract_pages(pdf_files):
+        all_texts.append("\n".join(filter(None, (text for _, text in pages))))
     return all_texts
 
 def generate_embeddings(texts):
-    """Generate embeddings for a list of texts."""
-    embeddings = index.embed(texts)
+    """Generate embeddings for a list of texts, batched and rate limited."""
+    embeddings = build_scheduler().embed(texts)
     return embeddings
 
 def query_model(embeddings):
-    """Query the OpenAI GPT-4 Turbo model based on embeddings."""
-    responses = []
-    for embedding in embeddings:
+    """Query the OpenAI GPT-4 Turbo model based on embeddings, several requests at a time."""
+    def query_one(embedding):
         response = openai.Completion.create(
             model="gpt-4-turbo",
             prompt="",  # You can adjust the prompt if needed
@@ -46,8 +42,8 @@ def query_model(embeddings):
                 "data": embedding
             }
         )
-        responses.append(response.choices[0].text.strip())
-    return responses
+        return response.choices[0].text.strip()
+    return map_ordered(query_one, embeddings)
 
 def main():
     st.title("PDF Processor with LlamaIndex and GPT-4 Turbo")
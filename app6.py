@@ -1,130 +1,126 @@
 import streamlit as st
-from PyPDF2 import PdfReader, PdfWriter
-import tempfile
 import os
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, ServiceContext, StorageContext
-from openai import Completion
-import openai
-from llama_index.llms.openai import OpenAI
-from pathlib import Path
-import shutil
-from io import BytesIO
+from warmup import shared_resource, start_warmup
+
+# llama_index, openai and the PDF libraries take seconds to import, so they
+# are imported where used; the warm-up thread loads them (and builds the
+# clients) while the first page renders.
 
 # Set OpenAI API Key
-openai.api_key = st.secrets["openai_key"]
+os.environ.setdefault("OPENAI_API_KEY", st.secrets["openai_key"])
 
 def main():
     st.title("RAG System with Streamlit, LLaMA-Index, and GPT-4")
     st.write("Upload multiple PDF files to merge and query using GPT-4.")
     
     if "messages" not in st.session_state.keys(): # Initialize the chat messages history
-    st.session_state.messages = [
-        {"role": "assistant", "content": "Welcome to math tutor!"}
-    ]
+        st.session_state.messages = [
+            {"role": "assistant", "content": "Welcome to math tutor!"}
+        ]
 
 
     uploaded_files = st.file_uploader("Upload PDF files", accept_multiple_files=True, type=['pdf'])
 
+    # Heavy modules are imported only in the branches that need them, so a
+    # first visit without uploads does not wait for the warm-up imports
     if uploaded_files:
+        from index_cache import corpus_key
+        from pdf_tools import merged_pdf_path
+        from chat_ui import hash_uploads
+
+        uploaded_files = hash_uploads(uploaded_files)
         st.write(f"{len(uploaded_files)} PDF files uploaded.")
-        merged_pdf_path = merge_pdfs(uploaded_files)
-        if merged_pdf_path:
-            st.write("PDF files merged successfully!")
-            with open(merged_pdf_path, "rb") as file:
+        # The merged PDF is only needed for download, so build it on request and reuse it from the cache
+        if st.button("Prepare merged PDF") or merged_pdf_path(uploaded_files).exists():
+            merged_path = merge_pdfs(uploaded_files)
+            if merged_path:
+                # A callable is only read when the download is clicked, not on every rerun
                 st.download_button(
                     label="Download Merged PDF",
-                    data=file,
+                    data=merged_path.read_bytes,
                     file_name="merged_document.pdf",
                     mime="application/pdf"
                 )
 
-            # Indexing the merged PDF via llama-index
-            index, storage_dir = index_pdf(merged_pdf_path)
-
-            if index:
-                st.write("PDF indexed successfully! You can now ask questions.")
-
-                # Chat functionality
-                #user_input = st.text_input("Ask a question about the merged PDF:")
-                #if user_input:
-                #    response = query_index(index, user_input)
-                #   st.write(f"Answer: {response}")
-
-
-                if "chat_engine" not in st.session_state.keys(): # Initialize the chat engine
-                        st.session_state.chat_engine = index.as_chat_engine(chat_mode="condense_question", verbose=True)
-                
-                if prompt := st.chat_input("Your question"): # Prompt for user input and save to chat history
-                    st.session_state.messages.append({"role": "user", "content": prompt})
-                
-                for message in st.session_state.messages: # Display the prior chat messages
-                    with st.chat_message(message["role"]):
-                        st.write(message["content"])
-                
-                # If last message is not from assistant, generate a new response
-                if st.session_state.messages[-1]["role"] != "assistant":
-                    with st.chat_message("assistant"):
-                        with st.spinner("Thinking..."):
-                            response = st.session_state.chat_engine.chat(prompt)
-                            st.write(response.response)
-                            message = {"role": "assistant", "content": response.response}
-                            st.session_state.messages.append(message) # Add response to message history
+        # Indexing the uploaded PDFs via llama-index, reusing the previous index where possible
+        key = corpus_key(uploaded_files)
+        index, storage_dir = index_pdf(uploaded_files, key, st.session_state.get("corpus_key"))
+        if index and st.session_state.get("corpus_key") != key:
+            st.session_state.corpus_key = key
+            st.session_state.pop("chat_engine", None)
+
+        if index:
+            from hybrid_retrieval import build_chat_engine
+            from chat_ui import render_cache_controls, render_trace_panel, stream_chat_response
+
+            st.write("PDF indexed successfully! You can now ask questions.")
+
+            # Chat functionality
+            #user_input = st.text_input("Ask a question about the merged PDF:")
+            #if user_input:
+            #    response = query_index(index, user_input)
+            #   st.write(f"Answer: {response}")
+
+
+            if "chat_engine" not in st.session_state.keys(): # Initialize the chat engine
+                    st.session_state.chat_engine = build_chat_engine(index, st.session_state.corpus_key)
+            render_cache_controls()
+            render_trace_panel()
+            
+            if prompt := st.chat_input("Your question"): # Prompt for user input and save to chat history
+                st.session_state.messages.append({"role": "user", "content": prompt})
+            
+            for message in st.session_state.messages: # Display the prior chat messages
+                with st.chat_message(message["role"]):
+                    st.write(message["content"])
             
+            # If last message is not from assistant, generate a new response
+            if st.session_state.messages[-1]["role"] != "assistant":
+                with st.chat_message("assistant"):
+                    answer = stream_chat_response(st.session_state.chat_engine, prompt, st.session_state.corpus_key)
+                    message = {"role": "assistant", "content": answer}
+                    st.session_state.messages.append(message) # Add response to message history
+        
 
-            # Clean up temporary files
-            shutil.rmtree(storage_dir)
 
 def merge_pdfs(files):
-    pdf_writer = PdfWriter()
+    from pdf_tools import merged_pdf
+
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_merged_pdf:
-            for uploaded_file in files:
-                # Read the uploaded file as a stream
-                reader = PdfReader(BytesIO(uploaded_file.getvalue()))
-                for page_num in range(len(reader.pages)):
-                    pdf_writer.add_page(reader.pages[page_num])
-            pdf_writer.write(temp_merged_pdf)
-            return temp_merged_pdf.name
+        return merged_pdf(files)
     except Exception as e:
         st.error(f"An error occurred while merging PDFs: {e}")
         return None
 
+def llm_service_context():
+    # Shared by all sessions and pre-built by the warm-up thread
+    return shared_resource("llm_service_context", _build_llm_service_context)
 
-#@st.cache_resource(show_spinner=False)
-def index_pdf(pdf_path):
-    try:
-        # Create a temporary directory for storing indexed data
-        storage_dir = Path(tempfile.mkdtemp())
-        pdf_dir = storage_dir / "pdfs"
-        pdf_dir.mkdir(parents=True, exist_ok=True)
-
-        # Copy the merged PDF to the indexing directory
-        shutil.copy(pdf_path, pdf_dir)
-
-        # Read and index the PDF
-        # documents = SimpleDirectoryReader(pdf_dir).load_data()
-        # service_context = ServiceContext.from_defaults(llm=OpenAI(model="gpt-4-turbo", temperature=0.1, system_prompt="You are a tutor, answer questions from context"))
-        # index = VectorStoreIndex.from_documents(documents, service_context=service_context)
-
-        with st.spinner(text="Loading and indexing the docs – hang tight! This should take 2-10 minutes."):
-            # reader = SimpleDirectoryReader(input_dir="./data", recursive=True)
-            docs = SimpleDirectoryReader(pdf_dir).load_data()
-            service_context = ServiceContext.from_defaults(llm=OpenAI(model="gpt-4-turbo", temperature=0.1, system_prompt="You are atutor, answer questions from context"))
-            index = VectorStoreIndex.from_documents(docs, service_context=service_context)
-            return index
+def _build_llm_service_context():
+    from llama_index.llms.openai import OpenAI
+    from index_cache import build_service_context
 
+    return build_service_context(OpenAI(model="gpt-4-turbo", temperature=0.1, system_prompt="You are atutor, answer questions from context"))
 
-        
-        # Persist the index to disk
-        index.set_index_id("pdf_index")
-        index.storage_context.persist(storage_dir)
+def index_pdf(uploaded_files, key, base_key=None):
+    from index_cache import cache_dir
+    from chat_ui import index_in_background
 
-        return index, storage_dir
+    try:
+        service_context = llm_service_context()
+
+        # Builds run as deduplicated background jobs; until this one finishes
+        # its progress is shown and the page polls instead of blocking.
+        index = index_in_background(uploaded_files, key, service_context, base_key)
+        if index is None:
+            return None, None
+        return index, cache_dir(key)
     except Exception as e:
         st.error(f"An error occurred while indexing PDF: {e}")
         return None, None
 
 if __name__ == "__main__":
+    start_warmup({"llm_service_context": _build_llm_service_context})
     main()
 
 
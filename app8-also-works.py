@@ -1,16 +1,13 @@
 import streamlit as st
-from PyPDF2 import PdfReader, PdfWriter
-import tempfile
 import os
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, ServiceContext
-import openai
-from llama_index.llms.openai import OpenAI
-from pathlib import Path
-import shutil
-from io import BytesIO
+from warmup import shared_resource, start_warmup
+
+# llama_index, openai and the PDF libraries take seconds to import, so they
+# are imported where used; the warm-up thread loads them (and builds the
+# clients) while the first page renders.
 
 # Set OpenAI API Key
-openai.api_key = st.secrets["openai_key"]
+os.environ.setdefault("OPENAI_API_KEY", st.secrets["openai_key"])
 
 def main():
     st.title("DocTalk, talk to your docs  - Developed by Abhyas Manne")
@@ -18,31 +15,41 @@ def main():
 
     uploaded_files = st.file_uploader("Upload PDF files", accept_multiple_files=True, type=['pdf'])
 
+    # Heavy modules are imported only in the branches that need them, so a
+    # first visit without uploads does not wait for the warm-up imports
     if uploaded_files:
+        from index_cache import corpus_key
+        from pdf_tools import merged_pdf_path
+        from chat_ui import hash_uploads
+
+        uploaded_files = hash_uploads(uploaded_files)
         st.write(f"{len(uploaded_files)} PDF files uploaded.")
-        merged_pdf_path = merge_pdfs(uploaded_files)
-        if merged_pdf_path:
-            st.write("PDF files merged successfully!")
-            try:
-                with open(merged_pdf_path, "rb") as file:
-                    st.download_button(
-                        label="Download Merged PDF",
-                        data=file,
-                        file_name="merged_document.pdf",
-                        mime="application/pdf"
-                    )
-                index = None
-                storage_dir = None
-                if "temp_dir" not in st.session_state:
-                    st.session_state.temp_dir = tempfile.mkdtemp()
-                if "index" not in st.session_state:  # Initialize the index only once
-                    index, storage_dir = index_pdf(uploaded_files,st.session_state.temp_dir)
-                    if index is None or storage_dir is None:
-                        st.error("Failed to index PDF. Please try again.")
-                    else:
-                        st.session_state.index = index
-                        st.session_state.storage_dir = storage_dir
-                        st.write("Using the existing index..")
+        # The merged PDF is only needed for download, so build it on request and reuse it from the cache
+        if st.button("Prepare merged PDF") or merged_pdf_path(uploaded_files).exists():
+            merged_path = merge_pdfs(uploaded_files)
+            if merged_path:
+                # A callable is only read when the download is clicked, not on every rerun
+                st.download_button(
+                    label="Download Merged PDF",
+                    data=merged_path.read_bytes,
+                    file_name="merged_document.pdf",
+                    mime="application/pdf"
+                )
+        key = corpus_key(uploaded_files)
+        if st.session_state.get("corpus_key") != key:  # Index only the files that changed
+            from summaries import ensure_summary
+
+            index, storage_dir = index_pdf(uploaded_files, key, st.session_state.get("corpus_key"))
+            if index is None or storage_dir is None:
+                return  # Still indexing in the background, or the error is already shown
+            st.session_state.index = index
+            st.session_state.storage_dir = storage_dir
+            st.session_state.corpus_key = key
+            st.session_state.pop("chat_engine", None)
+            st.session_state.pop("batch_results", None)
+            ensure_summary(index, key)  # Start summarising right after indexing
+        else:
+            st.write("Using the existing index..")
 
 
 
@@ -51,81 +58,74 @@ def main():
        #         if "index" not in st.session_state:  # Initialize the index only once
        #             st.session_state.index, st.session_state.storage_dir = index_pdf(merged_pdf_path)
 
-                if st.session_state.index:
-                    st.write("PDF indexed successfully! You can now ask questions. Please wait a few seconds..")
-                   
-                    if "messages" not in st.session_state.keys(): # Initialize the chat messages history
-                        st.session_state.messages = [
-                            {"role": "assistant", "content": "Welcome to DocTalk"}
-                        ]
-                    
-                    if "chat_engine" not in st.session_state.keys(): # Initialize the chat engine
-                            st.session_state.chat_engine = index.as_chat_engine(chat_mode="condense_question", verbose=True)
-                    summary = st.session_state.chat_engine.chat("Summarize briefly")
-                    st.write("Brief summary of the uploaded documents:")
-                    st.write(summary.response)
-                    if prompt := st.chat_input("Your question"): # Prompt for user input and save to chat history
-                        st.session_state.messages.append({"role": "user", "content": prompt})
-                    
-                    for message in st.session_state.messages: # Display the prior chat messages
-                        with st.chat_message(message["role"]):
-                            st.write(message["content"])
-                    
-                    # If last message is not from assistant, generate a new response
-                    if st.session_state.messages[-1]["role"] != "assistant":
-                        with st.chat_message("assistant"):
-                            with st.spinner("Thinking..."):
-                                response = st.session_state.chat_engine.chat(prompt)
-                                st.write(response.response)
-                                message = {"role": "assistant", "content": response.response}
-                                st.session_state.messages.append(message) # Add response to message history
-
-                # Clean up temporary files
-                if st.session_state.storage_dir and os.path.exists(st.session_state.storage_dir):
-                    shutil.rmtree(st.session_state.storage_dir)
-
-            finally:
-                os.remove(merged_pdf_path)
+        if st.session_state.get("index"):
+            from hybrid_retrieval import build_chat_engine
+            from chat_ui import render_batch_qa, render_cache_controls, render_summary, render_trace_panel, stream_chat_response
+
+            st.write("PDF indexed successfully! You can now ask questions. Please wait a few seconds..")
+           
+            if "messages" not in st.session_state.keys(): # Initialize the chat messages history
+                st.session_state.messages = [
+                    {"role": "assistant", "content": "Welcome to DocTalk"}
+                ]
+            
+            if "chat_engine" not in st.session_state.keys(): # Initialize the chat engine
+                    st.session_state.chat_engine = build_chat_engine(st.session_state.index, st.session_state.corpus_key)
+            render_cache_controls()
+            render_trace_panel()
+            render_summary(st.session_state.index, st.session_state.corpus_key)
+            render_batch_qa(st.session_state.index, st.session_state.corpus_key)
+            if prompt := st.chat_input("Your question"): # Prompt for user input and save to chat history
+                st.session_state.messages.append({"role": "user", "content": prompt})
+            
+            for message in st.session_state.messages: # Display the prior chat messages
+                with st.chat_message(message["role"]):
+                    st.write(message["content"])
+            
+            # If last message is not from assistant, generate a new response
+            if st.session_state.messages[-1]["role"] != "assistant":
+                with st.chat_message("assistant"):
+                    answer = stream_chat_response(st.session_state.chat_engine, prompt, st.session_state.corpus_key)
+                    message = {"role": "assistant", "content": answer}
+                    st.session_state.messages.append(message) # Add response to message history
+
 
 def merge_pdfs(files):
-    pdf_writer = PdfWriter()
-    temp_merged_pdf = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
+    from pdf_tools import merged_pdf
+
     try:
-        for uploaded_file in files:
-            reader = PdfReader(BytesIO(uploaded_file.getvalue()))
-            for page_num in range(len(reader.pages)):
-                pdf_writer.add_page(reader.pages[page_num])
-        pdf_writer.write(temp_merged_pdf)
-        temp_merged_pdf.close()
-        return temp_merged_pdf.name
+        return merged_pdf(files)
     except Exception as e:
         st.error(f"An error occurred while merging PDFs: {e}")
         return None
-    finally:
-        temp_merged_pdf.close()
-#@st.cache_resource(show_spinner=False)
-def index_pdf(uploaded_files,temp_dir):
-    try:
-        storage_dir = Path(temp_dir) / "storage"
-        pdf_dir = storage_dir / "pdfs"
-        pdf_dir.mkdir(parents=True, exist_ok=True)
 
-        for i, uploaded_file in enumerate(uploaded_files):
-            with open(pdf_dir / f"document_{i}.pdf", "wb") as file:
-                file.write(uploaded_file.getvalue())
+def llm_service_context():
+    # Shared by all sessions and pre-built by the warm-up thread
+    return shared_resource("llm_service_context", _build_llm_service_context)
+
+def _build_llm_service_context():
+    from llama_index.llms.openai import OpenAI
+    from index_cache import build_service_context
 
+    return build_service_context(OpenAI(model="gpt-4-turbo", temperature=0.1, system_prompt="You are assistant researcher who is helping young scholars read scientific articles. Initially provide a concise summary of the uploaded documents, then ask what the user wants to know more about. If the information is not within the context provided, then reply that you could not find the relavent information in the context, do not hallucinate." ))
 
-        with st.spinner("Indexing documents..."):
-            docs = SimpleDirectoryReader(pdf_dir).load_data()
-            service_context = ServiceContext.from_defaults(llm=OpenAI(model="gpt-4-turbo", temperature=0.1, system_prompt="You are assistant researcher who is helping young scholars read scientific articles. Initially provide a concise summary of the uploaded documents, then ask what the user wants to know more about. If the information is not within the context provided, then reply that you could not find the relavent information in the context, do not hallucinate." ))
-            index = VectorStoreIndex.from_documents(docs, service_context=service_context)
-            index.set_index_id("pdf_index")
-            index.storage_context.persist(storage_dir)
+def index_pdf(uploaded_files, key, base_key=None):
+    from index_cache import cache_dir
+    from chat_ui import index_in_background
 
-        return index, storage_dir
+    try:
+        service_context = llm_service_context()
+
+        # Builds run as deduplicated background jobs; until this one finishes
+        # its progress is shown and the page polls instead of blocking.
+        index = index_in_background(uploaded_files, key, service_context, base_key)
+        if index is None:
+            return None, None
+        return index, cache_dir(key)
     except Exception as e:
         st.error(f"An error occurred while indexing PDF: {e}")
         return None, None
 
 if __name__ == "__main__":
+    start_warmup({"llm_service_context": _build_llm_service_context})
     main()
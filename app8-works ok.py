@@ -8,6 +8,9 @@ from llama_index.llms.openai import OpenAI
 from pathlib import Path
 import shutil
 from io import BytesIO
+from index_cache import corpus_key
+from index_registry import session_index
+from hybrid_retrieval import build_chat_engine
 
 # Set OpenAI API Key
 openai.api_key = st.secrets["openai_key"]
@@ -33,7 +36,7 @@ def main():
                         mime="application/pdf"
                     )
 
-                index, storage_dir = index_pdf(merged_pdf_path)
+                index, storage_dir = index_pdf(merged_pdf_path, corpus_key(uploaded_files))
 
                 if index:
                     st.write("PDF indexed successfully! You can now ask questions.")
@@ -42,7 +45,7 @@ def main():
                         st.session_state['messages'] = []
 
                     if 'chat_engine' not in st.session_state or st.session_state['chat_engine'] is None:
-                        st.session_state['chat_engine'] = index.as_chat_engine(chat_mode="condense_question", verbose=True)
+                        st.session_state['chat_engine'] = build_chat_engine(index)
                     
                     if prompt := st.text_input("Your question:"):
                         st.session_state['messages'].append({"role": "user", "content": prompt})
@@ -76,23 +79,29 @@ def merge_pdfs(files):
         return None
     finally:
         temp_merged_pdf.close()
-@st.cache_resource(show_spinner=False)
-def index_pdf(pdf_path):
+def build_pdf_index(pdf_path):
+    storage_dir = Path(tempfile.mkdtemp())
     try:
-        storage_dir = Path(tempfile.mkdtemp())
         pdf_dir = storage_dir / "pdfs"
         pdf_dir.mkdir(parents=True, exist_ok=True)
 
         shutil.copy(pdf_path, pdf_dir / "merged_document.pdf")
 
+        docs = SimpleDirectoryReader(pdf_dir).load_data()
+        service_context = ServiceContext.from_defaults(llm=OpenAI(model="gpt-4-turbo", temperature=0.1))
+        index = VectorStoreIndex.from_documents(docs, service_context=service_context)
+        index.set_index_id("pdf_index")
+        return index
+    finally:
+        shutil.rmtree(storage_dir)
+
+def index_pdf(pdf_path, key):
+    try:
         with st.spinner("Indexing documents..."):
-            docs = SimpleDirectoryReader(pdf_dir).load_data()
-            service_context = ServiceContext.from_defaults(llm=OpenAI(model="gpt-4-turbo", temperature=0.1))
-            index = VectorStoreIndex.from_documents(docs, service_context=service_context)
-            index.set_index_id("pdf_index")
-            index.storage_context.persist(storage_dir)
+            # Keyed on the uploaded bytes, not the merged temp path, so every session on the same files shares one index
+            index = session_index(st.session_state, key, lambda: build_pdf_index(pdf_path))
 
-        return index, storage_dir
+        return index, None
     except Exception as e:
         st.error(f"An error occurred while indexing PDF: {e}")
         return None, None
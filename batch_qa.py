@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from answer_cache import cached_answer
+from hybrid_retrieval import build_query_engine
+from tracing import span
+
+RESULT_FIELDS = ["position", "question", "answer", "seconds", "sources", "cache", "error"]
+
+
+def map_ordered(function, items, max_workers=None):
+    """Applies ``function`` to ``items`` on a bounded thread pool and returns results in input order."""
+    items = list(items)
+    workers = max(1, min(max_workers or config.BATCH_QA_WORKERS, len(items) or 1))
+    if workers == 1:
+        return [function(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(function, items))
+
+
+def source_labels(response):
+    """Returns the file and page labels of a response's source chunks, duplicates' files included."""
+    labels = []
+    for source in getattr(response, "source_nodes", None) or []:
+        metadata = source.node.metadata
+        label = metadata.get("file_name", "")
+        if metadata.get("page_label"):
+            label = f"{label} p.{metadata['page_label']}"
+        if label and label not in labels:
+            labels.append(label)
+        for label in metadata.get("also_in", []):
+            if label not in labels:
+                labels.append(label)
+    return labels
+
+
+def answer_question(query_engine, position, question, corpus_key=None, bypass_cache=False):
+    """Answers one question and records how long it took; failures are captured, not raised."""
+    started = time.perf_counter()
+    sources = []
+
+    def ask(text):
+        response = query_engine.query(text)
+        sources.extend(source_labels(response))
+        return response.response
+
+    try:
+        with span("batch_question", position=position):
+            answer, hit = cached_answer(corpus_key, question, ask, bypass=bypass_cache, sources=sources)
+        cache, error = hit.tier if hit else "", ""
+    except Exception as e:
+        answer, cache, error = "", "", str(e)
+    return {
+        "position": position,
+        "question": question,
+        "answer": answer,
+        "seconds": round(time.perf_counter() - started, 3),
+        "sources": sources,
+        "cache": cache,
+        "error": error,
+    }
+
+
+def run_batch(index, questions, max_workers=None, corpus_key=None, bypass_cache=False):
+    """Runs retrieval and answering for a checklist of questions concurrently.
+
+    Blank lines are skipped. Returns one result dict per question, in the
+    order the questions were given, with the per-question wall time. When
+    ``corpus_key`` is given, answers go through the corpus answer cache.
+    """
+    questions = [question.strip() for question in questions if question.strip()]
+    query_engine = build_query_engine(index, corpus_key)
+    return map_ordered(
+        lambda item: answer_question(query_engine, item[0], item[1], corpus_key, bypass_cache),
+        enumerate(questions, start=1),
+        max_workers,
+    )
+
+
+def results_to_json(results):
+    """Serialises batch results as a JSON array."""
+    return json.dumps(results, indent=2, ensure_ascii=False)
+
+
+def results_to_csv(results):
+    """Serialises batch results as CSV, one row per question."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=RESULT_FIELDS)
+    writer.writeheader()
+    for result in results:
+        writer.writerow({**result, "sources": "; ".join(result["sources"])})
+    return buffer.getvalue()
@@ -0,0 +1,335 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+WORDS = (
+    "gradient loss model layer training batch retrieval index vector query document page clause "
+    "section contract supplier warranty invoice delivery quarter revenue margin forecast sensor "
+    "pressure valve torque assembly tolerance calibration protocol sample analysis result method"
+).split()
+LINES_PER_PAGE = 40
+WORDS_PER_LINE = 12
+
+
+def _pdf_text(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """Writes a minimal uncompressed PDF with one Helvetica text block per page."""
+    objects = ["<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    pages_id = 2 + 2 * len(pages)
+    page_ids = []
+    for lines in pages:
+        content = "BT /F1 9 Tf 40 760 Td 11 TL " + " ".join(f"({_pdf_text(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        objects.append(
+            f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 612 792] "
+            f"/Contents {len(objects)} 0 R /Resources << /Font << /F1 1 0 R >> >> >>"
+        )
+        page_ids.append(len(objects))
+    objects.append(f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>")
+    objects.append(f"<< /Type /Catalog /Pages {pages_id} 0 R >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += b"".join(f"{offset:010d} 00000 n \n".encode("latin-1") for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root {len(objects)} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    Path(path).write_bytes(out)
+
+
+def make_corpus(directory, files, pages, seed=0):
+    """Generates ``files`` synthetic PDFs of ``pages`` pages each and returns their paths and queries.
+
+    Every page mentions a unique part number, so each query has a known
+    target page for keyword-heavy retrieval. Pages carry a running header
+    and a numbered footer like real reports do.
+    """
+    rng = random.Random(seed)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths, queries = [], []
+    for file_number in range(files):
+        document = []
+        for page_number in range(pages):
+            part = f"PN-{file_number:03d}-{page_number:04d}"
+            lines = [" ".join(rng.choice(WORDS) for _ in range(WORDS_PER_LINE)) for _ in range(LINES_PER_PAGE - 3)]
+            lines.insert(len(lines) // 2, f"Document {file_number} page {page_number + 1}: part number {part}")
+            lines.insert(0, f"Technical handbook {file_number} - confidential - do not distribute")
+            lines.append(f"Page {page_number + 1} of {pages}")
+            document.append(lines)
+            queries.append(f"What is said about part number {part} and its {rng.choice(WORDS)}?")
+        path = directory / f"doc-{file_number:03d}.pdf"
+        write_pdf(path, document)
+        paths.append(path)
+    rng.shuffle(queries)
+    return paths, queries
+
+
+def _max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+class Recorder:
+    """Times benchmark stages and records items/second and memory for each.
+
+    ``max_rss_mb`` is the process high-water mark after the stage. With
+    ``trace_memory`` the stage's own peak Python allocation is traced too,
+    but tracemalloc slows allocation-heavy stages such as pdfminer several
+    times over, so their timings are not comparable with untraced runs.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name, items=0, unit="items"):
+        result = {"items": items, "unit": unit}
+        if self.trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            yield result
+        finally:
+            seconds = time.perf_counter() - started
+            result["seconds"] = round(seconds, 4)
+            result["throughput"] = round(result["items"] / seconds, 2) if seconds and result["items"] else None
+            result["max_rss_mb"] = round(_max_rss_mb(), 1)
+            result["peak_mb"] = None
+            if self.trace_memory:
+                result["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+                tracemalloc.stop()
+            self.stages[name] = result
+
+    def skip(self, name, reason):
+        self.stages[name] = {"skipped": reason}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).resolve().parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _latencies(function, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        function(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+    }
+
+
+def run(args, workdir):
+    """Runs every stage over a fresh synthetic corpus and returns the results dict."""
+    # Imported here so the environment set up in main() is what config reads
+    from llama_index.core import VectorStoreIndex
+    from llama_index.core.llms import MockLLM
+    from llama_index.core.schema import MetadataMode
+
+    import config
+    from bm25_index import BM25Index
+    from boilerplate import StripStats, strip_boilerplate
+    from dedupe import DedupeStats, MinHashDeduper
+    from extraction import extract_pages
+    from hybrid_retrieval import HybridRetriever, build_query_engine
+    from index_cache import (
+        build_service_context,
+        collapse_duplicates,
+        file_digest,
+        load_cached_index,
+        new_storage_context,
+        page_document,
+        persist_index,
+    )
+    from pdf_tools import merged_pdf
+
+    recorder = Recorder(args.trace_memory)
+    total_pages = args.files * args.pages
+
+    with recorder.stage("generate_corpus", total_pages, "pages"):
+        paths, queries = make_corpus(Path(workdir) / "corpus", args.files, args.pages, args.seed)
+    queries = queries[:args.queries]
+
+    with recorder.stage("merge_pdfs", total_pages, "pages"):
+        merged_pdf(paths)
+
+    with recorder.stage("extract_pdfplumber", total_pages, "pages"):
+        extracted = extract_pages(paths)
+
+    stripped = StripStats()
+    with recorder.stage("strip_boilerplate", total_pages, "pages") as stage:
+        documents = []
+        for path, pages in zip(paths, extracted):
+            if config.STRIP_BOILERPLATE:
+                pages = strip_boilerplate(pages, stripped)
+            digest = file_digest(path)
+            for page_number, text in pages:
+                documents.append(page_document(path.name, digest, page_number, text))
+        stage.update(stripped_chars=stripped.chars, stripped_tokens=stripped.tokens)
+
+    try:
+        from llama_index.core import SimpleDirectoryReader
+        from llama_index.readers.file import PDFReader  # noqa: F401 - SimpleDirectoryReader needs it for PDFs
+
+        with recorder.stage("extract_simple_directory_reader", total_pages, "pages"):
+            SimpleDirectoryReader(input_files=[str(path) for path in paths]).load_data()
+    except ImportError:
+        recorder.skip("extract_simple_directory_reader", "llama-index-readers-file is not installed")
+
+    service_context = build_service_context(MockLLM())
+    with recorder.stage("chunk", unit="nodes") as stage:
+        nodes = service_context.node_parser.get_nodes_from_documents(documents)
+        stage["items"] = len(nodes)
+
+    if config.DEDUPE_CHUNKS:
+        deduped = DedupeStats()
+        with recorder.stage("dedupe", len(nodes), "nodes") as stage:
+            nodes = collapse_duplicates(nodes, MinHashDeduper(), {}, deduped)
+            stage.update(duplicates=deduped.duplicates, duplicate_tokens=deduped.tokens)
+    else:
+        recorder.skip("dedupe", "RAG_DEDUPE=0")
+
+    with recorder.stage("embed", len(nodes), "nodes"):
+        # The text the app embeds, which leaves out the page metadata
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        embeddings = service_context.embed_model.get_text_embedding_batch(texts)
+        for node, embedding in zip(nodes, embeddings):
+            node.embedding = embedding
+
+    with recorder.stage("index_and_bm25", len(nodes), "nodes"):
+        index = VectorStoreIndex(nodes, service_context=service_context, storage_context=new_storage_context())
+        bm25 = BM25Index.from_nodes(nodes)
+
+    key = "benchmark"
+    with recorder.stage("persist", len(nodes), "nodes"):
+        persist_index(index, key, {}, bm25)
+
+    with recorder.stage("load", len(nodes), "nodes"):
+        index = load_cached_index(key, service_context)
+
+    vector_retriever = index.as_retriever(similarity_top_k=config.HYBRID_TOP_K)
+    with recorder.stage("retrieve_vector", len(queries), "queries") as stage:
+        stage.update(_latencies(vector_retriever.retrieve, queries))
+
+    hybrid = HybridRetriever(index, bm25)
+    with recorder.stage("retrieve_hybrid", len(queries), "queries") as stage:
+        stage.update(_latencies(hybrid.retrieve, queries))
+
+    # The app's query path: hybrid retrieval (if enabled) and the context budget
+    query_engine = build_query_engine(index, key)
+    with recorder.stage("query_stub_llm", len(queries), "queries") as stage:
+        stage.update(_latencies(query_engine.query, queries))
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {
+                "files": args.files,
+                "pages": args.pages,
+                "queries": len(queries),
+                "seed": args.seed,
+                "trace_memory": args.trace_memory,
+                "chunk_size": config.CHUNK_SIZE,
+                "embed_model": service_context.embed_model.model_name,
+                "vector_store": config.VECTOR_STORE,
+                "strip_boilerplate": config.STRIP_BOILERPLATE,
+                "dedupe_threshold": config.DEDUPE_THRESHOLD if config.DEDUPE_CHUNKS else None,
+            },
+        },
+        "stages": recorder.stages,
+        "max_rss_mb": round(_max_rss_mb(), 1),
+    }
+
+
+def print_report(results, baseline=None):
+    if baseline and baseline["meta"]["params"] != results["meta"]["params"]:
+        print("note: the baseline was run with different parameters, so the ratios are only indicative")
+    print(f"{'stage':<34}{'seconds':>10}{'throughput':>18}{'peak MB':>10}{'RSS MB':>10}{'vs base':>10}")
+    for name, stage in results["stages"].items():
+        if "skipped" in stage:
+            print(f"{name:<34}  skipped: {stage['skipped']}")
+            continue
+        throughput = f"{stage['throughput']:.1f} {stage['unit']}/s" if stage["throughput"] else ""
+        ratio = ""
+        base = (baseline or {}).get("stages", {}).get(name)
+        if base and base.get("seconds"):
+            ratio = f"{stage['seconds'] / base['seconds']:.2f}x"
+        peak = "" if stage["peak_mb"] is None else f"{stage['peak_mb']:.1f}"
+        print(f"{name:<34}{stage['seconds']:>10.3f}{throughput:>18}{peak:>10}{stage['max_rss_mb']:>10.1f}{ratio:>10}")
+    stripped = results["stages"].get("strip_boilerplate", {})
+    if stripped.get("stripped_chars"):
+        print(f"boilerplate stripped: {stripped['stripped_chars']} chars (~{stripped['stripped_tokens']} tokens)")
+    print(f"max RSS: {results['max_rss_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the ingestion and query pipeline.")
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=25, help="pages per file")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="earlier results JSON to compare stage times against")
+    parser.add_argument("--trace-memory", action="store_true", help="trace per-stage peak allocations (slows stages down)")
+    parser.add_argument("--keep", action="store_true", help="keep the generated corpus and caches")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="rag-benchmark-")
+    # Offline and uncached: deterministic local embedder, private cache directories
+    os.environ["RAG_EMBED_BACKEND"] = "hash"
+    os.environ["RAG_CACHE_DIR"] = os.path.join(workdir, "cache")
+    os.environ["RAG_EMBED_CACHE_PATH"] = os.path.join(workdir, "cache", "embeddings.sqlite3")
+    try:
+        results = run(args, workdir)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(results, handle, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as handle:
+            baseline = json.load(handle)
+    print_report(results, baseline)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
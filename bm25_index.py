@@ -0,0 +1,109 @@
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+
+import config
+
+PERSIST_NAME = "bm25.json"
+# Keeps identifiers like "A-113.4", "ISO/IEC" or "x_1" together as one token
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercases text into words, emitting compound identifiers and their parts."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """Inverted index over node texts scored with Okapi BM25.
+
+    Postings map each term to ``{node_id: term_frequency}`` so a query only
+    touches the nodes that contain at least one of its terms. Nodes can be
+    added and removed, which lets the index follow incremental re-indexing.
+    """
+
+    def __init__(self, postings=None, doc_lengths=None, k1=None, b=None):
+        self.postings = postings or {}
+        self.doc_lengths = doc_lengths or {}
+        self.k1 = config.BM25_K1 if k1 is None else k1
+        self.b = config.BM25_B if b is None else b
+        self._total_length = sum(self.doc_lengths.values())
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    @classmethod
+    def from_nodes(cls, nodes):
+        index = cls()
+        index.add_nodes(nodes)
+        return index
+
+    def add(self, node_id, text):
+        if node_id in self.doc_lengths:
+            self.remove_nodes([node_id])
+        counts = Counter(tokenize(text))
+        for term, frequency in counts.items():
+            self.postings.setdefault(term, {})[node_id] = frequency
+        length = sum(counts.values())
+        self.doc_lengths[node_id] = length
+        self._total_length += length
+
+    def add_nodes(self, nodes):
+        for node in nodes:
+            self.add(node.node_id, node.get_content())
+
+    def remove_nodes(self, node_ids):
+        node_ids = set(node_ids) & set(self.doc_lengths)
+        if not node_ids:
+            return
+        for node_id in node_ids:
+            self._total_length -= self.doc_lengths.pop(node_id)
+        # Terms are not stored per node, so sweep the postings; removals are rare
+        for term in list(self.postings):
+            docs = self.postings[term]
+            for node_id in node_ids & docs.keys():
+                del docs[node_id]
+            if not docs:
+                del self.postings[term]
+
+    def search(self, query, top_k):
+        """Returns up to ``top_k`` ``(node_id, score)`` pairs, best first."""
+        if not self.doc_lengths:
+            return []
+        count = len(self.doc_lengths)
+        average_length = self._total_length / count or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for node_id, frequency in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[node_id] / average_length)
+                scores[node_id] = scores.get(node_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    def persist(self, persist_dir):
+        path = os.path.join(persist_dir, PERSIST_NAME)
+        with open(path, "w", encoding="utf-8") as handle:
+            json.dump({"k1": self.k1, "b": self.b, "doc_lengths": self.doc_lengths, "postings": self.postings}, handle)
+
+    @staticmethod
+    def exists(persist_dir):
+        return os.path.exists(os.path.join(persist_dir, PERSIST_NAME))
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir):
+        with open(os.path.join(persist_dir, PERSIST_NAME), "r", encoding="utf-8") as handle:
+            data = json.load(handle)
+        return cls(data["postings"], data["doc_lengths"], data["k1"], data["b"])
@@ -0,0 +1,112 @@
+import re
+from collections import Counter
+from itertools import chain
+
+import config
+from embeddings import estimate_tokens
+
+_DIGITS = re.compile(r"\d+")
+_SPACES = re.compile(r"\s+")
+
+
+def boilerplate_settings():
+    """Returns the stripping settings that shape an index, or None when stripping is off."""
+    if not config.STRIP_BOILERPLATE:
+        return None
+    return {
+        "min_fraction": config.BOILERPLATE_MIN_FRACTION,
+        "min_pages": config.BOILERPLATE_MIN_PAGES,
+        "sample_pages": config.BOILERPLATE_SAMPLE_PAGES,
+        "edge_lines": config.BOILERPLATE_EDGE_LINES,
+    }
+
+
+def line_signature(line, edge=True):
+    """Normalises a line so running headers match across pages: case and spacing are ignored.
+
+    Near the top or bottom of a page (``edge``) numbers are ignored too, so
+    "Page 3 of 40" and "Page 4 of 40" share a signature; in the body they
+    are kept, so lines that differ only by an ID are never merged.
+    """
+    signature = _SPACES.sub(" ", line.strip().lower())
+    return _DIGITS.sub("#", signature) if edge else signature
+
+
+def page_signatures(text, edge_lines=None):
+    """Returns the signature of every line of a page, in order."""
+    edge_lines = config.BOILERPLATE_EDGE_LINES if edge_lines is None else edge_lines
+    lines = text.splitlines()
+    # On short pages most lines would count as edges, so shrink the margin
+    edge_lines = min(edge_lines, len(lines) // 4)
+    return [
+        line_signature(line, position < edge_lines or position >= len(lines) - edge_lines)
+        for position, line in enumerate(lines)
+    ]
+
+
+def find_boilerplate(pages, min_fraction=None, min_pages=None):
+    """Returns the signatures of lines repeated on at least ``min_fraction`` of ``pages``.
+
+    ``pages`` is a list of page texts. Each line counts once per page, and
+    nothing is boilerplate in documents shorter than ``min_pages``.
+    """
+    min_fraction = config.BOILERPLATE_MIN_FRACTION if min_fraction is None else min_fraction
+    min_pages = config.BOILERPLATE_MIN_PAGES if min_pages is None else min_pages
+    if len(pages) < max(2, min_pages):
+        return set()
+    counts = Counter()
+    for text in pages:
+        counts.update(set(page_signatures(text)) - {""})
+    threshold = max(2, min_fraction * len(pages))
+    return {signature for signature, count in counts.items() if count >= threshold}
+
+
+class StripStats:
+    """Running totals of what boilerplate stripping removed."""
+
+    def __init__(self):
+        self.pages = 0
+        self.lines = 0
+        self.chars = 0
+        self.tokens = 0
+
+    def to_dict(self):
+        return {"pages": self.pages, "lines": self.lines, "chars": self.chars, "tokens": self.tokens}
+
+
+def strip_lines(text, boilerplate, stats=None):
+    """Removes lines whose signature is in ``boilerplate`` from one page of text."""
+    if not boilerplate:
+        return text
+    kept, removed = [], []
+    for line, signature in zip(text.splitlines(), page_signatures(text)):
+        (removed if signature in boilerplate else kept).append(line)
+    if stats is not None and removed:
+        removed_text = "\n".join(removed)
+        stats.lines += len(removed)
+        stats.chars += len(removed_text) + 1
+        stats.tokens += estimate_tokens(removed_text)
+    return "\n".join(kept)
+
+
+def strip_boilerplate(pages, stats=None, sample_pages=None):
+    """Yields ``(page_number, text)`` with running headers, footers and repeated boilerplate removed.
+
+    Repeated lines are learned from the first ``sample_pages`` pages, which
+    are the only ones held in memory; later pages are cleaned as they stream
+    past. Page numbers are passed through untouched, so page metadata still
+    points at the original page. ``stats`` collects what was removed.
+    """
+    sample_pages = sample_pages or config.BOILERPLATE_SAMPLE_PAGES
+    pages = iter(pages)
+    sample = []
+    for page in pages:
+        sample.append(page)
+        if len(sample) >= sample_pages:
+            break
+    boilerplate = find_boilerplate([text for _, text in sample])
+    for page_number, text in chain(sample, pages):
+        if stats is not None:
+            stats.pages += 1
+        yield page_number, strip_lines(text, boilerplate, stats)
+
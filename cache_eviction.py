@@ -0,0 +1,105 @@
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import config
+from library import load_library
+
+MERGED_DIR = "merged"
+# Entries used this recently are kept whatever the limits, which covers
+# indexes another process has open and the base of an upload set in use
+GRACE_SECONDS = 3600
+_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+logger = logging.getLogger(__name__)
+
+_prune_lock = threading.Lock()
+
+
+def touch(path):
+    """Marks a cached index directory or merged PDF as just used."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _tree_bytes(path):
+    if path.is_file():
+        return path.stat().st_size
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def cache_entries(root=None):
+    """Returns ``(last_used, bytes, key, path)`` for each cached index and merged PDF, oldest first."""
+    root = Path(root or config.CACHE_ROOT)
+    candidates = []
+    if root.exists():
+        candidates += [(path.name, path) for path in root.iterdir() if path.is_dir() and _KEY_PATTERN.match(path.name)]
+    merged = root / MERGED_DIR
+    if merged.exists():
+        candidates += [(None, path) for path in merged.glob("*.pdf")]
+    entries = []
+    for key, path in candidates:
+        try:
+            entries.append((path.stat().st_mtime, _tree_bytes(path), key, path))
+        except OSError:
+            continue  # Removed meanwhile
+    entries.sort(key=lambda entry: entry[0])
+    return entries
+
+
+def prune_cache(keep=(), max_bytes=None, max_age_days=None, now=None):
+    """Deletes least recently used cached indexes and merged PDFs over the size or age limit.
+
+    Each incremental upload step persists a full index under a new key and
+    a new merged PDF, so without this the cache keeps every intermediate
+    copy. Indexes loaded in this process, listed in the ingest library, in
+    ``keep`` or used within GRACE_SECONDS are never deleted. Returns the
+    number of entries removed and the bytes freed.
+    """
+    from index_registry import shared_registry
+
+    max_bytes = int(config.CACHE_MAX_GB * 1024 ** 3) if max_bytes is None else max_bytes
+    max_age_days = config.CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    now = time.time() if now is None else now
+    if not _prune_lock.acquire(blocking=False):
+        return 0, 0  # Another build is already pruning
+    try:
+        protected = set(keep) | set(shared_registry().keys())
+        protected |= {entry["key"] for entry in load_library().values()}
+        entries = cache_entries()
+        total = sum(size for _, size, _, _ in entries)
+        removed = freed = 0
+        for last_used, size, key, path in entries:
+            too_old = max_age_days > 0 and now - last_used > max_age_days * 86400
+            if not too_old and (max_bytes <= 0 or total <= max_bytes):
+                continue
+            if key in protected or now - last_used < GRACE_SECONDS:
+                continue
+            try:
+                if path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+            freed += size
+        if removed:
+            logger.info("Pruned %d cache entries, freeing %.1f MB", removed, freed / 1024 ** 2)
+        return removed, freed
+    finally:
+        _prune_lock.release()
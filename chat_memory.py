@@ -0,0 +1,155 @@
+import logging
+import threading
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.memory.types import BaseMemory
+
+import config
+from context_budget import count_tokens
+from tracing import span
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+SUMMARY_PROMPT = (
+    "Progressively summarise a conversation between a user and an assistant about some documents. "
+    "Extend the previous summary with the new lines, keeping names, numbers, decisions and open "
+    "questions. Stay under {words} words.\n\n"
+    "Previous summary:\n{summary}\n\n"
+    "New lines:\n{lines}\n\n"
+    "New summary:"
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _tokens(message):
+    return count_tokens(message.content or "") + 4  # Role and separators
+
+
+class RollingSummaryMemory(BaseMemory):
+    """Chat memory that keeps recent turns verbatim and folds older ones into a running summary.
+
+    ``get`` returns the summary as a system message followed by the newest
+    whole turns that fit in ``token_limit``, so the condense-question prompt
+    stays the same size however long the session runs. Turns pushed out of
+    the window are summarised by one LLM call on a background thread, which
+    only sees the previous summary and the new turns; until it finishes they
+    are left out of the prompt rather than making the user wait. Without an
+    LLM older turns are simply dropped.
+    """
+
+    token_limit: int = Field(default_factory=lambda: config.CHAT_MEMORY_TOKENS)
+    summary_token_limit: int = Field(default_factory=lambda: config.CHAT_SUMMARY_TOKENS)
+    llm: object = Field(default=None, exclude=True)
+
+    _messages = PrivateAttr()
+    _summary = PrivateAttr()
+    _folding = PrivateAttr()
+    _lock = PrivateAttr()
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._messages = []  # The window plus turns waiting to be summarised
+        self._summary = ""
+        self._folding = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def class_name(cls):
+        return "RollingSummaryMemory"
+
+    @classmethod
+    def from_defaults(cls, chat_history=None, llm=None, token_limit=None, summary_token_limit=None):
+        memory = cls(
+            token_limit=token_limit or config.CHAT_MEMORY_TOKENS,
+            summary_token_limit=summary_token_limit or config.CHAT_SUMMARY_TOKENS,
+            llm=llm,
+        )
+        memory.set(chat_history or [])
+        return memory
+
+    @property
+    def summary(self):
+        return self._summary
+
+    def _window_start(self):
+        """Index of the oldest message in the window.
+
+        The window starts at a user turn and always holds the latest turn,
+        even when that alone is over the limit.
+        """
+        used, start = 0, None
+        for position in range(len(self._messages) - 1, -1, -1):
+            used += _tokens(self._messages[position])
+            if used > self.token_limit and start is not None:
+                break
+            if self._messages[position].role == MessageRole.USER:
+                start = position
+        return start or 0
+
+    def _with_summary(self, messages):
+        if not self._summary:
+            return list(messages)
+        return [ChatMessage(role=MessageRole.SYSTEM, content=SUMMARY_PREFIX + self._summary)] + list(messages)
+
+    def get(self, input=None, **kwargs):
+        with self._lock:
+            return self._with_summary(self._messages[self._window_start():])
+
+    def get_all(self):
+        with self._lock:
+            return self._with_summary(self._messages)
+
+    def put(self, message):
+        with self._lock:
+            self._messages.append(message)
+            self._maybe_fold()
+
+    def set(self, messages):
+        with self._lock:
+            self._messages = list(messages)
+            self._maybe_fold()
+
+    def reset(self):
+        with self._lock:
+            self._messages = []
+            self._summary = ""
+
+    def _maybe_fold(self):
+        # Called with the lock held
+        start = self._window_start()
+        if not start or (self._folding is not None and self._folding.is_alive()):
+            return
+        if self.llm is None:
+            del self._messages[:start]
+            return
+        overflow = self._messages[:start]
+        self._folding = threading.Thread(target=self._fold, args=(overflow, self._summary), name="chat-memory", daemon=True)
+        self._folding.start()
+
+    def _fold(self, overflow, summary):
+        lines = "\n".join(f"{message.role.value}: {message.content}" for message in overflow)
+        prompt = SUMMARY_PROMPT.format(words=self.summary_token_limit * 3 // 4, summary=summary or "(none)", lines=lines)
+        try:
+            with span("memory_summary", messages=len(overflow)):
+                summary = self.llm.complete(prompt).text.strip()
+        except Exception:
+            logger.exception("Failed to summarise %d chat messages; dropping them", len(overflow))
+        # Keep the summary bounded even if the model ignores the word limit
+        summary = summary[:self.summary_token_limit * 4]
+        with self._lock:
+            # Anything added meanwhile stays; only the folded messages go
+            if self._messages[:len(overflow)] == overflow:
+                del self._messages[:len(overflow)]
+                self._summary = summary
+            self._folding = None
+            self._maybe_fold()
+
+
+def remember_turn(chat_engine, prompt, answer):
+    """Records a turn answered outside the engine, such as from the answer cache, in its memory."""
+    # Cached turns never reach the engine, so record them for later condensation
+    memory = getattr(chat_engine, "_memory", None)
+    if memory is not None:
+        memory.put(ChatMessage(role=MessageRole.USER, content=prompt))
+        memory.put(ChatMessage(role=MessageRole.ASSISTANT, content=answer))
@@ -0,0 +1,248 @@
+import time
+
+import streamlit as st
+
+import config
+from answer_cache import cached_answer
+from batch_qa import results_to_csv, results_to_json, run_batch
+from chat_memory import remember_turn
+from hybrid_retrieval import build_query_engine
+from index_cache import build_index, file_digest
+from index_registry import session_index, shared_registry
+from ingest_jobs import CANCELLED, DONE, FAILED, shared_jobs
+from summaries import ensure_summary, summary_error
+from tracing import shared_tracer, span
+from warmup import shared_warmup
+
+
+def _text(written):
+    # st.write_stream returns a list when the stream yields non-string chunks
+    return written if isinstance(written, str) else "".join(str(part) for part in written)
+
+
+def _timed_tokens(tokens, current):
+    # Records time to first token on the enclosing span
+    started = time.perf_counter()
+    for position, token in enumerate(tokens):
+        if position == 0 and current is not None:
+            current.set(first_token_ms=round((time.perf_counter() - started) * 1000, 3))
+        yield token
+
+
+def _generate_chat_response(chat_engine, prompt):
+    with span("chat", streaming=config.STREAM_RESPONSES) as current:
+        if not config.STREAM_RESPONSES:
+            with st.spinner("Thinking..."):
+                response = chat_engine.chat(prompt)
+            st.write(response.response)
+            return response.response
+
+        with st.spinner("Thinking..."):
+            response = chat_engine.stream_chat(prompt)
+        return _text(st.write_stream(_timed_tokens(response.response_gen, current)))
+
+
+def _generate_query_response(index, query, corpus_key=None):
+    with span("query", streaming=config.STREAM_RESPONSES) as current:
+        if not config.STREAM_RESPONSES:
+            with st.spinner("Thinking..."):
+                response = build_query_engine(index, corpus_key).query(query)
+            st.write(response.response)
+            return response.response
+
+        with st.spinner("Thinking..."):
+            response = build_query_engine(index, corpus_key, streaming=True).query(query)
+        return _text(st.write_stream(_timed_tokens(response.response_gen, current)))
+
+
+def _show_cache_hit(hit):
+    st.write(hit.answer)
+    st.caption(f"Answered from the {hit.tier} answer cache")
+
+
+def _fill_trace_panel():
+    placeholder = st.session_state.get("trace_panel")
+    trace_id = st.session_state.get("last_trace_id")
+    if placeholder is None:
+        return
+    spans = shared_tracer().trace(trace_id) if trace_id else []
+    with placeholder.container():
+        if not spans:
+            st.caption("Ask a question to see where its time went.")
+            return
+        depths = {}
+        rows = []
+        for record in spans:
+            depth = depths[record["span_id"]] = depths.get(record["parent_id"], -1) + 1
+            attributes = record["attributes"]
+            rows.append({
+                "step": "\u2003" * depth + record["name"],
+                "ms": record["duration_ms"],
+                "tokens": sum(attributes.get(kind, 0) or 0 for kind in ("prompt_tokens", "completion_tokens", "embedding_tokens")),
+                "cache": ", ".join(f"{key.replace('_cache_', ' ')}={value}" for key, value in attributes.items() if "_cache_" in key),
+            })
+        st.dataframe(rows, use_container_width=True, hide_index=True)
+
+
+def _show_trace(turn):
+    if turn is not None:
+        st.session_state.last_trace_id = turn.trace_id
+        _fill_trace_panel()
+
+
+def render_trace_panel():
+    """Shows an optional sidebar table of the last turn's steps, with timings, tokens and cache results."""
+    if not config.TRACE_ENABLED or not st.sidebar.checkbox("Show timings", key="show_timings"):
+        st.session_state.pop("trace_panel", None)
+        return
+    st.session_state.trace_panel = st.sidebar.empty()
+    _fill_trace_panel()
+    st.sidebar.download_button(
+        "Download metrics", shared_tracer().render_prometheus(), file_name="metrics.prom", mime="text/plain"
+    )
+    warmup = shared_warmup()
+    if warmup is not None and warmup.done.is_set():
+        with st.sidebar.expander("Start-up timings"):
+            st.text(warmup.report())
+
+
+def render_summary(index, corpus_key):
+    """Shows the corpus summary, a note while it is generated, or the failure with a retry button."""
+    summary = ensure_summary(index, corpus_key)
+    st.write("Brief summary of the uploaded documents:")
+    if summary is not None:
+        st.write(summary)
+        return
+    error = summary_error(corpus_key)
+    if error is None:
+        st.info("The summary is being prepared in the background and will appear on the next interaction.")
+        return
+    st.warning(f"The summary could not be generated: {error}")
+    if st.button("Retry summary"):
+        ensure_summary(index, corpus_key, retry=True)
+        st.rerun()
+
+
+def render_cache_controls():
+    """Shows the per-question answer cache bypass switch in the sidebar."""
+    st.sidebar.checkbox("Skip answer cache", key="bypass_answer_cache")
+
+
+def _trim_transcript():
+    # The engine's memory is bounded on its own; this bounds what every rerun redraws
+    messages = st.session_state.get("messages")
+    limit = config.CHAT_DISPLAY_MESSAGES
+    if messages and len(messages) > limit + 1:
+        del messages[1:len(messages) - limit]  # Keep the welcome message
+
+
+def stream_chat_response(chat_engine, prompt, corpus_key=None):
+    """Renders the chat engine's answer as it is generated and returns the final text.
+
+    Question condensation and retrieval still happen behind the spinner; the
+    answer tokens are then written incrementally, so perceived latency is
+    time to first token rather than time to the full answer. Opening
+    questions are served from the corpus answer cache when possible;
+    follow-ups depend on the conversation and always go to the engine.
+    """
+    _trim_transcript()
+    bypass = st.session_state.get("bypass_answer_cache", False) or bool(chat_engine.chat_history)
+    with span("chat_turn") as turn:
+        answer, hit = cached_answer(corpus_key, prompt, lambda question: _generate_chat_response(chat_engine, question), bypass)
+    if hit is not None:
+        _show_cache_hit(hit)
+        remember_turn(chat_engine, prompt, answer)
+    _show_trace(turn)
+    return answer
+
+
+def stream_query_response(index, query, corpus_key=None):
+    """Renders a one-off query answer as it is generated and returns the final text."""
+    bypass = st.session_state.get("bypass_answer_cache", False)
+    with span("query_turn") as turn:
+        answer, hit = cached_answer(corpus_key, query, lambda question: _generate_query_response(index, question, corpus_key), bypass)
+    if hit is not None:
+        _show_cache_hit(hit)
+    _show_trace(turn)
+    return answer
+
+
+def render_batch_qa(index, corpus_key=None):
+    """Shows the checklist form: answers many questions at once and offers CSV/JSON downloads."""
+    with st.expander("Batch questions"):
+        checklist = st.text_area("One question per line", key="batch_questions")
+        if st.button("Run checklist") and checklist.strip():
+            with st.spinner("Answering questions..."):
+                st.session_state.batch_results = run_batch(
+                    index,
+                    checklist.splitlines(),
+                    corpus_key=corpus_key,
+                    bypass_cache=st.session_state.get("bypass_answer_cache", False),
+                )
+
+        results = st.session_state.get("batch_results")
+        if results:
+            st.dataframe(
+                [{**result, "sources": "; ".join(result["sources"])} for result in results],
+                use_container_width=True,
+            )
+            st.download_button("Download CSV", results_to_csv(results), file_name="answers.csv", mime="text/csv")
+            st.download_button("Download JSON", results_to_json(results), file_name="answers.json", mime="application/json")
+
+
+def _render_job_progress(job):
+    st.progress(job.files_done / max(job.files_total, 1), text=f"Indexing documents: {job.stage}...")
+    st.caption(
+        f"{job.files_done}/{job.files_total} files, {job.pages} pages extracted, "
+        f"{job.chunks} chunks embedded, {time.time() - job.submitted_at:.0f}s elapsed"
+    )
+
+
+def hash_uploads(files):
+    """Attaches each upload's SHA-256, computed once per file in the session, and returns the files.
+
+    Every rerun gets fresh upload objects, so without this the corpus and
+    merge keys would re-read each upload on every poll of a running build.
+    """
+    known = st.session_state.get("upload_digests", {})
+    digests = {}
+    for file in files or []:
+        file_id = getattr(file, "file_id", None)
+        if file_id is None:
+            continue
+        file.sha256 = digests[file_id] = known.get(file_id) or file_digest(file)
+    st.session_state.upload_digests = digests  # Forget files no longer uploaded
+    return files
+
+
+def index_in_background(files, key, service_context, base_key=None):
+    """Returns the shared index for ``files`` once built; until then shows the ingest job's progress.
+
+    The build runs on the ingest worker pool, so script reruns only poll it
+    and cannot start it twice. Returns None while the job is running or
+    after it failed or was cancelled.
+    """
+    if shared_registry().contains(key):
+        return session_index(st.session_state, key, lambda: build_index(files, key, service_context, base_key))
+
+    jobs = shared_jobs()
+    job = jobs.submit(key, files, service_context, base_key)
+    if job.status == DONE:
+        index = session_index(st.session_state, key, job.result)
+        jobs.forget(job)
+        return index
+    if job.status in (FAILED, CANCELLED):
+        if job.status == FAILED:
+            st.error(f"An error occurred while indexing PDF: {job.error}")
+        else:
+            st.warning("Indexing was cancelled.")
+        if st.button("Restart indexing"):
+            jobs.submit(key, files, service_context, base_key, retry=True)
+            st.rerun()
+        return None
+
+    _render_job_progress(job)
+    if st.button("Cancel indexing"):
+        job.cancel()
+    time.sleep(config.INGEST_POLL_SECONDS)
+    st.rerun()
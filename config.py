@@ -0,0 +1,188 @@
+import os
+from pathlib import Path
+
+# Root directory for persisted indexes; override with RAG_CACHE_DIR.
+CACHE_ROOT = Path(os.environ.get("RAG_CACHE_DIR", Path.home() / ".cache" / "iamgoodrag"))
+
+# Cache eviction. After each index build or PDF merge, the least recently
+# used cached indexes and merged PDFs are deleted while the cache holds more
+# than CACHE_MAX_GB, as are any unused for CACHE_MAX_AGE_DAYS. Indexes in
+# library.json or loaded in the process are kept. 0 disables a limit.
+CACHE_MAX_GB = float(os.environ.get("RAG_CACHE_MAX_GB", 20))
+CACHE_MAX_AGE_DAYS = float(os.environ.get("RAG_CACHE_MAX_AGE_DAYS", 30))
+
+# Chunking and embedding settings. These feed the index cache key, so
+# changing any of them produces a fresh index instead of a stale hit.
+CHUNK_SIZE = int(os.environ.get("RAG_CHUNK_SIZE", 1024))
+CHUNK_OVERLAP = int(os.environ.get("RAG_CHUNK_OVERLAP", 200))
+EMBED_MODEL = os.environ.get("RAG_EMBED_MODEL", "text-embedding-ada-002")
+# "openai" calls the embeddings API; "hash" is a deterministic in-process
+# embedder for offline runs and tests.
+EMBED_BACKEND = os.environ.get("RAG_EMBED_BACKEND", "openai")
+HASH_EMBED_DIM = int(os.environ.get("RAG_HASH_EMBED_DIM", 256))
+
+# Page-level PDF text extraction. Pages are split into runs of
+# EXTRACT_PAGES_PER_TASK and spread over up to EXTRACT_WORKERS processes;
+# set RAG_EXTRACT_WORKERS=1 to extract serially.
+EXTRACT_WORKERS = int(os.environ.get("RAG_EXTRACT_WORKERS", min(os.cpu_count() or 1, 8)))
+EXTRACT_PAGES_PER_TASK = int(os.environ.get("RAG_EXTRACT_PAGES_PER_TASK", 4))
+
+# Streaming ingestion. Chunks are embedded and inserted in batches of at
+# most INGEST_BATCH_SIZE nodes; a batch is also flushed early once its
+# buffered text reaches INGEST_MEMORY_LIMIT_MB. Embedding rows not yet
+# persisted are spilled to a temporary file in the cache directory once
+# they reach the same size. Node text and metadata stay in the in-memory
+# docstore until the index is persisted, so peak memory still grows with
+# the extracted text of the upload, though no longer with its vectors.
+INGEST_BATCH_SIZE = int(os.environ.get("RAG_INGEST_BATCH_SIZE", 128))
+INGEST_MEMORY_LIMIT_MB = float(os.environ.get("RAG_INGEST_MEMORY_LIMIT_MB", 32))
+
+# Boilerplate stripping before chunking. Lines repeated on at least
+# BOILERPLATE_MIN_FRACTION of a file's first BOILERPLATE_SAMPLE_PAGES pages,
+# such as running headers, footers and page numbers, are removed from every
+# page; within BOILERPLATE_EDGE_LINES of the top or bottom of a page numbers
+# are ignored when matching. Files shorter than BOILERPLATE_MIN_PAGES are
+# left alone. These feed the index cache key too; RAG_STRIP_BOILERPLATE=0
+# turns it off.
+STRIP_BOILERPLATE = os.environ.get("RAG_STRIP_BOILERPLATE", "1") != "0"
+BOILERPLATE_MIN_FRACTION = float(os.environ.get("RAG_BOILERPLATE_MIN_FRACTION", 0.5))
+BOILERPLATE_MIN_PAGES = int(os.environ.get("RAG_BOILERPLATE_MIN_PAGES", 3))
+BOILERPLATE_SAMPLE_PAGES = int(os.environ.get("RAG_BOILERPLATE_SAMPLE_PAGES", 50))
+BOILERPLATE_EDGE_LINES = int(os.environ.get("RAG_BOILERPLATE_EDGE_LINES", 3))
+
+# Near-duplicate chunks, e.g. from several revisions of one document, are
+# found with MinHash over DEDUPE_SHINGLE_WORDS-word shingles and collapsed
+# into the first stored copy when their estimated Jaccard similarity is at
+# least DEDUPE_THRESHOLD. These feed the index cache key too;
+# RAG_DEDUPE=0 turns it off.
+DEDUPE_CHUNKS = os.environ.get("RAG_DEDUPE", "1") != "0"
+DEDUPE_THRESHOLD = float(os.environ.get("RAG_DEDUPE_THRESHOLD", 0.9))
+DEDUPE_NUM_PERM = int(os.environ.get("RAG_DEDUPE_NUM_PERM", 128))
+DEDUPE_SHINGLE_WORDS = int(os.environ.get("RAG_DEDUPE_SHINGLE_WORDS", 5))
+
+# Corpora indexed in parallel by the headless ingest CLI (python ingest.py).
+INGEST_WORKERS = int(os.environ.get("RAG_INGEST_WORKERS", 4))
+
+# Background indexing in the apps: builds run on INGEST_JOB_WORKERS threads
+# and the page re-polls their progress every INGEST_POLL_SECONDS.
+INGEST_JOB_WORKERS = int(os.environ.get("RAG_INGEST_JOB_WORKERS", 2))
+INGEST_POLL_SECONDS = float(os.environ.get("RAG_INGEST_POLL_SECONDS", 1.0))
+
+# Embedding scheduler. Texts are sent EMBED_BATCH_SIZE at a time with up to
+# EMBED_CONCURRENCY requests in flight, within the per-minute budgets
+# (0 disables a budget). Failed batches are retried with jittered
+# exponential backoff.
+EMBED_BATCH_SIZE = int(os.environ.get("RAG_EMBED_BATCH_SIZE", 32))
+EMBED_CONCURRENCY = int(os.environ.get("RAG_EMBED_CONCURRENCY", 4))
+EMBED_REQUESTS_PER_MINUTE = int(os.environ.get("RAG_EMBED_RPM", 3000))
+EMBED_TOKENS_PER_MINUTE = int(os.environ.get("RAG_EMBED_TPM", 1000000))
+EMBED_MAX_RETRIES = int(os.environ.get("RAG_EMBED_MAX_RETRIES", 5))
+
+# Persistent embedding cache shared by every session and index build.
+# Entries are keyed by (embedding model, normalised chunk text) and the
+# least recently used ones are evicted past EMBED_CACHE_MAX_MB; 0 disables it.
+EMBED_CACHE_PATH = Path(os.environ.get("RAG_EMBED_CACHE_PATH", CACHE_ROOT / "embeddings.sqlite3"))
+EMBED_CACHE_MAX_MB = float(os.environ.get("RAG_EMBED_CACHE_MAX_MB", 1024))
+
+# Render chat answers token by token as they are generated; set
+# RAG_STREAM_RESPONSES=0 to wait for the full answer instead.
+STREAM_RESPONSES = os.environ.get("RAG_STREAM_RESPONSES", "1") != "0"
+
+# Chat memory. Recent turns are kept verbatim up to CHAT_MEMORY_TOKENS and
+# older ones folded into a rolling summary of about CHAT_SUMMARY_TOKENS, so
+# each turn's condense-question prompt stays the same size however long the
+# session runs; apps can pass their own limits to build_chat_engine. The
+# on-screen transcript keeps the last CHAT_DISPLAY_MESSAGES messages.
+CHAT_MEMORY_TOKENS = int(os.environ.get("RAG_CHAT_MEMORY_TOKENS", 1500))
+CHAT_SUMMARY_TOKENS = int(os.environ.get("RAG_CHAT_SUMMARY_TOKENS", 300))
+CHAT_DISPLAY_MESSAGES = int(os.environ.get("RAG_CHAT_DISPLAY_MESSAGES", 200))
+
+# Corpus summaries: after a failed summary job no new one starts for
+# SUMMARY_RETRY_SECONDS unless the user asks to retry.
+SUMMARY_RETRY_SECONDS = float(os.environ.get("RAG_SUMMARY_RETRY_SECONDS", 300))
+
+# Batch question answering: number of questions answered concurrently.
+BATCH_QA_WORKERS = int(os.environ.get("RAG_BATCH_QA_WORKERS", 8))
+
+# Answer cache, scoped to the corpus content hash. A question is answered
+# from cache when it matches a previous one exactly (after normalisation)
+# or its embedding is within ANSWER_CACHE_SIMILARITY cosine of one that
+# names the same numbers and identifiers (e.g. part or clause numbers).
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("RAG_ANSWER_CACHE_MAX_ENTRIES", 2048))
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("RAG_ANSWER_CACHE_TTL_SECONDS", 24 * 3600))
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("RAG_ANSWER_CACHE_SIMILARITY", 0.95))
+
+# Vector store backend for new indexes: "numpy" keeps embeddings in a
+# memory-mapped float32 matrix, "simple" is llama_index's JSON store.
+VECTOR_STORE = os.environ.get("RAG_VECTOR_STORE", "numpy")
+
+# Approximate nearest-neighbour search (IVF). Indexes with at least
+# ANN_MIN_ROWS vectors get k-means centroids at persist time and are
+# searched by probing the ANN_NPROBE closest lists; raise ANN_NPROBE for
+# recall, lower it for latency. ANN_NLIST=0 picks about 4 * sqrt(rows).
+ANN_MIN_ROWS = int(os.environ.get("RAG_ANN_MIN_ROWS", 20000))
+ANN_NLIST = int(os.environ.get("RAG_ANN_NLIST", 0))
+ANN_NPROBE = int(os.environ.get("RAG_ANN_NPROBE", 8))
+ANN_TRAIN_SAMPLE = int(os.environ.get("RAG_ANN_TRAIN_SAMPLE", 50000))
+ANN_KMEANS_ITERATIONS = int(os.environ.get("RAG_ANN_KMEANS_ITERATIONS", 15))
+
+# Hybrid retrieval: BM25 over an inverted index fused with vector search by
+# reciprocal rank fusion. Each retriever contributes HYBRID_CANDIDATES hits
+# and the HYBRID_TOP_K best fused chunks go into the prompt.
+HYBRID_RETRIEVAL = os.environ.get("RAG_HYBRID_RETRIEVAL", "1") != "0"
+HYBRID_CANDIDATES = int(os.environ.get("RAG_HYBRID_CANDIDATES", 10))
+HYBRID_TOP_K = int(os.environ.get("RAG_HYBRID_TOP_K", 3))
+RRF_K = int(os.environ.get("RAG_RRF_K", 60))
+
+# Context assembly. CONTEXT_CANDIDATES chunks are retrieved, reranked by
+# retrieval rank and query-term coverage (CONTEXT_RETRIEVAL_WEIGHT weighs
+# the former), near-identical ones (word-pair Jaccard of at least
+# CONTEXT_REDUNDANCY) are dropped and the rest packed into
+# CONTEXT_TOKEN_BUDGET prompt tokens, counting the system prompt and
+# question. RAG_CONTEXT_TOKEN_BUDGET=0 sends the HYBRID_TOP_K retrieved
+# chunks as they are.
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("RAG_CONTEXT_TOKEN_BUDGET", 3000))
+CONTEXT_CANDIDATES = int(os.environ.get("RAG_CONTEXT_CANDIDATES", 12))
+CONTEXT_REDUNDANCY = float(os.environ.get("RAG_CONTEXT_REDUNDANCY", 0.7))
+CONTEXT_RETRIEVAL_WEIGHT = float(os.environ.get("RAG_CONTEXT_RETRIEVAL_WEIGHT", 0.5))
+BM25_K1 = float(os.environ.get("RAG_BM25_K1", 1.2))
+BM25_B = float(os.environ.get("RAG_BM25_B", 0.75))
+
+# Loaded indexes are shared by every session of a process. Indexes no
+# session holds are evicted, least recently used first, once their
+# estimated total size exceeds INDEX_REGISTRY_MAX_MB.
+INDEX_REGISTRY_MAX_MB = float(os.environ.get("RAG_INDEX_REGISTRY_MAX_MB", 2048))
+
+# Start-up: the apps import llama_index and the PDF libraries and build
+# their LLM and embedding clients on a background thread while the first
+# page renders. RAG_WARMUP=0 leaves all of that to the first request.
+WARMUP_ENABLED = os.environ.get("RAG_WARMUP", "1") != "0"
+
+# Tracing: per-step spans with token counts and cache results. Finished
+# spans are kept in a buffer of the last TRACE_BUFFER_SIZE and aggregated
+# into Prometheus text metrics at METRICS_PATH ("" to skip the file). Set
+# TRACE_LOG_PATH to also append every span to a JSON lines log, which is
+# rotated to "<path>.1" once it reaches TRACE_LOG_MAX_MB. Both files are
+# written by a background thread, off the request path.
+TRACE_ENABLED = os.environ.get("RAG_TRACE", "1") != "0"
+TRACE_BUFFER_SIZE = int(os.environ.get("RAG_TRACE_BUFFER_SIZE", 5000))
+TRACE_LOG_PATH = os.environ.get("RAG_TRACE_LOG_PATH", "")
+TRACE_LOG_MAX_MB = float(os.environ.get("RAG_TRACE_LOG_MAX_MB", 50))
+METRICS_PATH = os.environ.get("RAG_METRICS_PATH", str(CACHE_ROOT / "metrics.prom"))
+
+# Headless HTTP API (api_server.py). At most API_MAX_CONCURRENT ingest,
+# query and chat requests run at once; later ones wait up to
+# API_QUEUE_TIMEOUT_SECONDS and then get a 503. Chat sessions idle for
+# API_SESSION_TTL_SECONDS are dropped, as are the least recently used
+# ones beyond API_MAX_SESSIONS. RAG_API_LLM=mock answers with llama_index's
+# MockLLM, which with RAG_EMBED_BACKEND=hash needs no network at all.
+API_HOST = os.environ.get("RAG_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("RAG_API_PORT", 8000))
+API_MAX_CONCURRENT = int(os.environ.get("RAG_API_MAX_CONCURRENT", 16))
+API_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("RAG_API_QUEUE_TIMEOUT_SECONDS", 30))
+API_MAX_UPLOAD_MB = float(os.environ.get("RAG_API_MAX_UPLOAD_MB", 200))
+API_SESSION_TTL_SECONDS = float(os.environ.get("RAG_API_SESSION_TTL_SECONDS", 3600))
+API_MAX_SESSIONS = int(os.environ.get("RAG_API_MAX_SESSIONS", 1000))
+API_LLM = os.environ.get("RAG_API_LLM", "openai")
+API_LLM_MODEL = os.environ.get("RAG_API_LLM_MODEL", "gpt-4-turbo")
+API_SYSTEM_PROMPT = os.environ.get("RAG_API_SYSTEM_PROMPT", "You are a research assistant, answer questions from context")
@@ -0,0 +1,144 @@
+import math
+from functools import lru_cache
+
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.prompts.chat_prompts import CHAT_TEXT_QA_PROMPT
+from llama_index.core.schema import MetadataMode, NodeWithScore
+
+import config
+from bm25_index import tokenize
+from embeddings import estimate_tokens
+from tracing import span
+
+TOKEN_COUNT_CACHE_SIZE = 16384
+
+
+@lru_cache(maxsize=1)
+def _tokenizer():
+    try:
+        from llama_index.core.utils import get_tokenizer
+
+        return get_tokenizer()
+    except Exception:  # tiktoken missing, or its encoding cannot be downloaded
+        return None
+
+
+@lru_cache(maxsize=TOKEN_COUNT_CACHE_SIZE)
+def count_tokens(text):
+    """Counts tokens with the LLM tokenizer, or estimates them if it is unavailable; results are cached."""
+    tokenizer = _tokenizer()
+    return len(tokenizer(text)) if tokenizer is not None else estimate_tokens(text)
+
+
+@lru_cache(maxsize=1)
+def prompt_overhead_tokens():
+    """Tokens the question-answering template adds around the context and question."""
+    messages = CHAT_TEXT_QA_PROMPT.format_messages(context_str="", query_str="")
+    return sum(count_tokens(message.content or "") for message in messages)
+
+
+def _jaccard(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def rerank(query, nodes, retrieval_weight=None):
+    """Reorders retrieved nodes by a blend of retrieval rank and query-term coverage.
+
+    Coverage weighs each query term by its rarity among the candidates, so
+    a chunk that contains the distinctive terms of the question moves up
+    even if retrieval ranked it low. Returns ``[(score, bigrams, node), ...]``
+    best first, with each node's word-pair set for redundancy checks.
+    """
+    retrieval_weight = config.CONTEXT_RETRIEVAL_WEIGHT if retrieval_weight is None else retrieval_weight
+    query_terms = set(tokenize(query))
+    node_tokens = [tokenize(node.node.get_content()) for node in nodes]
+    node_terms = [set(tokens) for tokens in node_tokens]
+    weights = {
+        term: math.log(1 + len(nodes) / (1 + sum(term in terms for terms in node_terms)))
+        for term in query_terms
+    }
+    total = sum(weights.values()) or 1.0
+    ranked = []
+    for rank, (node, tokens, terms) in enumerate(zip(nodes, node_tokens, node_terms)):
+        coverage = sum(weight for term, weight in weights.items() if term in terms) / total
+        position = 1.0 - rank / len(nodes)
+        score = retrieval_weight * position + (1 - retrieval_weight) * coverage
+        ranked.append((score, set(zip(tokens, tokens[1:])), node))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    return ranked
+
+
+class ContextBudget(BaseNodePostprocessor):
+    """Reranks over-retrieved chunks, drops near-identical ones and packs the rest into a token budget.
+
+    ``reserved_tokens`` (the system prompt) plus the question and the
+    answer template are charged to the budget first. Chunks are then taken
+    best first while they fit; if none fits, the best one is cut down.
+    """
+
+    token_budget: int = Field(default_factory=lambda: config.CONTEXT_TOKEN_BUDGET)
+    reserved_tokens: int = Field(default=0)
+    redundancy: float = Field(default_factory=lambda: config.CONTEXT_REDUNDANCY)
+
+    @classmethod
+    def class_name(cls):
+        return "ContextBudget"
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        if not nodes:
+            return nodes
+        with span("context_budget") as traced:
+            selected, stats = self._pack(nodes, query_bundle.query_str if query_bundle else "")
+            if traced is not None:
+                traced.set(**stats)
+        return selected
+
+    def _pack(self, nodes, query):
+        available = self.token_budget - self.reserved_tokens - prompt_overhead_tokens() - count_tokens(query)
+
+        selected, kept_bigrams, used = [], [], 0
+        redundant = over_budget = 0
+        ranked = rerank(query, nodes)
+        for score, bigrams, node in ranked:
+            if any(_jaccard(bigrams, other) >= self.redundancy for other in kept_bigrams):
+                redundant += 1
+                continue
+            tokens = count_tokens(node.node.get_content(metadata_mode=MetadataMode.LLM))
+            if used + tokens > available:
+                over_budget += 1
+                continue
+            selected.append(NodeWithScore(node=node.node, score=score))
+            kept_bigrams.append(bigrams)
+            used += tokens
+
+        if not selected and available > 0:
+            score, _, node = ranked[0]
+            selected.append(NodeWithScore(node=_truncated(node.node, available), score=score))
+            used = available
+
+        return selected, {
+            "candidates": len(nodes),
+            "nodes": len(selected),
+            "context_tokens": used,
+            "redundant": redundant,
+            "over_budget": over_budget,
+        }
+
+
+def _truncated(node, max_tokens):
+    """Returns a copy of ``node`` whose text is cut to roughly ``max_tokens`` tokens."""
+    tokens = count_tokens(node.get_content(metadata_mode=MetadataMode.LLM))
+    truncated = node.copy()
+    truncated.text = node.text[:int(len(node.text) * max_tokens / tokens)]
+    return truncated
+
+
+def build_context_budget(service_context):
+    """Returns the ContextBudget postprocessor for an index, or None when budgeting is off."""
+    if config.CONTEXT_TOKEN_BUDGET <= 0:
+        return None
+    system_prompt = getattr(service_context.llm, "system_prompt", None) or ""
+    return ContextBudget(reserved_tokens=count_tokens(system_prompt) if system_prompt else 0)
@@ -0,0 +1,166 @@
+import os
+import re
+import zlib
+
+import numpy as np
+
+import config
+from embeddings import estimate_tokens
+
+PERSIST_NAME = "dedupe.npz"
+# Universal hashing (a * x + b) mod a Mersenne prime; a, b < 2**31 keeps a * x
+# within uint64 for 32-bit shingle hashes
+_PRIME = np.uint64((1 << 61) - 1)
+_SEED = 1234
+_WORD = re.compile(r"\w+")
+LSH_MARGIN = 0.1
+
+
+def dedupe_settings():
+    """Returns the dedupe settings that shape an index, or None when dedupe is off."""
+    if not config.DEDUPE_CHUNKS:
+        return None
+    return {
+        "threshold": config.DEDUPE_THRESHOLD,
+        "num_perm": config.DEDUPE_NUM_PERM,
+        "shingle_words": config.DEDUPE_SHINGLE_WORDS,
+    }
+
+
+def shingles(text, size=None):
+    """Returns the CRC32 hashes of the overlapping ``size``-word shingles of a text."""
+    size = size or config.DEDUPE_SHINGLE_WORDS
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return np.fromiter({zlib.crc32(gram.encode("utf-8")) for gram in grams}, dtype=np.uint64)
+
+
+def lsh_bands(threshold, num_perm):
+    """Picks ``(bands, rows)`` so pairs at ``threshold`` almost always share an LSH bucket.
+
+    The collision curve's midpoint, about ``(1 / bands) ** (1 / rows)``, is
+    placed LSH_MARGIN below the threshold: candidates are verified anyway,
+    so extra candidates only cost a comparison while a missed pair costs an
+    embedding.
+    """
+    target = max(0.05, threshold - LSH_MARGIN)
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1.0 / bands) ** (1.0 / rows) - target)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHashDeduper:
+    """Finds near-duplicate chunks with MinHash signatures and LSH banding.
+
+    Signatures estimate the Jaccard similarity of word shingles; LSH buckets
+    turn lookups into a few dictionary probes, and every bucket candidate is
+    confirmed against ``threshold`` before it counts as a duplicate. Only
+    canonical (stored) chunks are kept, keyed by node ID.
+    """
+
+    def __init__(self, threshold=None, num_perm=None, signatures=None):
+        self.threshold = config.DEDUPE_THRESHOLD if threshold is None else threshold
+        self.num_perm = num_perm or config.DEDUPE_NUM_PERM
+        rng = np.random.default_rng(_SEED)
+        self._a = rng.integers(1, 1 << 31, self.num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, self.num_perm, dtype=np.uint64)
+        self.bands, self.rows = lsh_bands(self.threshold, self.num_perm)
+        self.signatures = {}
+        self._buckets = [{} for _ in range(self.bands)]
+        for node_id, signature in (signatures or {}).items():
+            self.add(node_id, signature=signature)
+
+    def __len__(self):
+        return len(self.signatures)
+
+    @classmethod
+    def from_nodes(cls, nodes):
+        deduper = cls()
+        for node in nodes:
+            deduper.add(node.node_id, node.get_content())
+        return deduper
+
+    def signature(self, text):
+        hashes = shingles(text)
+        if not len(hashes):
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        permuted = (np.outer(hashes, self._a) + self._b) % _PRIME
+        return (permuted.min(axis=0) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def match(self, text=None, signature=None):
+        """Returns ``(node_id, similarity)`` of the closest stored duplicate, or ``(None, 0.0)``."""
+        signature = self.signature(text) if signature is None else signature
+        candidates = set()
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(key, ()))
+        best, best_similarity = None, 0.0
+        for node_id in candidates:
+            similarity = float(np.mean(self.signatures[node_id] == signature))
+            if similarity >= self.threshold and similarity > best_similarity:
+                best, best_similarity = node_id, similarity
+        return best, best_similarity
+
+    def add(self, node_id, text=None, signature=None):
+        signature = self.signature(text) if signature is None else np.asarray(signature, dtype=np.uint32)
+        self.signatures[node_id] = signature
+        for bucket, key in zip(self._buckets, self._band_keys(signature)):
+            bucket.setdefault(key, set()).add(node_id)
+
+    def remove_nodes(self, node_ids):
+        for node_id in node_ids:
+            signature = self.signatures.pop(node_id, None)
+            if signature is None:
+                continue
+            for bucket, key in zip(self._buckets, self._band_keys(signature)):
+                members = bucket.get(key)
+                if members is not None:
+                    members.discard(node_id)
+                    if not members:
+                        del bucket[key]
+
+    def persist(self, persist_dir):
+        node_ids = list(self.signatures)
+        matrix = np.stack([self.signatures[node_id] for node_id in node_ids]) if node_ids else np.empty((0, self.num_perm), dtype=np.uint32)
+        with open(os.path.join(persist_dir, PERSIST_NAME), "wb") as handle:
+            np.savez(handle, node_ids=np.asarray(node_ids, dtype=str), signatures=matrix, threshold=self.threshold)
+
+    @staticmethod
+    def exists(persist_dir):
+        return os.path.exists(os.path.join(persist_dir, PERSIST_NAME))
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir):
+        with np.load(os.path.join(persist_dir, PERSIST_NAME)) as data:
+            signatures = dict(zip(data["node_ids"].tolist(), data["signatures"]))
+            return cls(float(data["threshold"]), data["signatures"].shape[1], signatures)
+
+
+class DedupeStats:
+    """Running totals of chunks seen and duplicates collapsed before embedding."""
+
+    def __init__(self):
+        self.chunks = 0
+        self.duplicates = 0
+        self.chars = 0
+        self.tokens = 0
+
+    def count(self, node, duplicate):
+        self.chunks += 1
+        if duplicate:
+            text = node.get_content()
+            self.duplicates += 1
+            self.chars += len(text)
+            self.tokens += estimate_tokens(text)
+
+    def to_dict(self):
+        return {"chunks": self.chunks, "duplicates": self.duplicates, "chars": self.chars, "tokens": self.tokens}
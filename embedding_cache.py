@@ -0,0 +1,128 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from pathlib import Path
+
+import config
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def normalize_text(text):
+    """Normalises Unicode and whitespace so trivially different copies of a chunk share a key."""
+    return WHITESPACE_PATTERN.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_key(text):
+    """Returns the SHA-256 of the normalised text."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding cache with size-based LRU eviction.
+
+    Vectors are stored as float32 blobs keyed by ``(model, text hash)``. Once
+    the stored vectors exceed ``max_bytes`` the least recently used entries
+    are deleted until the cache is back under 90% of the limit.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._total_bytes = None
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model, texts):
+        """Returns ``{position: vector}`` for the texts that are already cached."""
+        keys = [text_key(text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = list(dict.fromkeys(keys[start:start + 500]))
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *chunk],
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, text_hash) for text_hash in found],
+                )
+                self._conn.commit()
+        vectors = {}
+        for position, key in enumerate(keys):
+            if key in found:
+                vectors[position] = array("f", found[key]).tolist()
+        self.hits += len(vectors)
+        self.misses += len(keys) - len(vectors)
+        return vectors
+
+    def put_many(self, model, texts, vectors):
+        """Stores embeddings for ``texts`` and evicts old entries if over budget."""
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            blob = array("f", vector).tobytes()
+            rows.append((model, text_key(text), blob, len(blob), now))
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+            self._total_bytes += sum(row[3] for row in rows)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        target = self._total_bytes - int(self.max_bytes * 0.9)
+        freed, victims = 0, []
+        for model, text_hash, size in self._conn.execute(
+            "SELECT model, text_hash, size FROM embeddings ORDER BY last_used"
+        ):
+            if freed >= target:
+                break
+            victims.append((model, text_hash))
+            freed += size
+        self._conn.executemany("DELETE FROM embeddings WHERE model = ? AND text_hash = ?", victims)
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def shared_cache():
+    """Returns the process-wide embedding cache, or None when it is disabled."""
+    global _shared_cache
+    if config.EMBED_CACHE_MAX_MB <= 0:
+        return None
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache(config.EMBED_CACHE_PATH, int(config.EMBED_CACHE_MAX_MB * 1024 * 1024))
+        return _shared_cache
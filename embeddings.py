@@ -0,0 +1,240 @@
+import asyncio
+import hashlib
+import math
+import random
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.embeddings import BaseEmbedding
+
+import config
+from embedding_cache import shared_cache
+from tracing import record_cache
+from warmup import shared_resource
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def estimate_tokens(text):
+    """Roughly estimates the token count of a text, at about four characters per token."""
+    return max(1, len(text) // 4)
+
+
+class RateLimiter:
+    """Token-bucket limiter for requests-per-minute and tokens-per-minute budgets."""
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, clock=time.monotonic, sleep=time.sleep):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens=0):
+        """Blocks until one request carrying ``tokens`` tokens fits in both budgets."""
+        if self.tokens_per_minute:
+            # A request bigger than the whole budget still goes once the bucket is full
+            tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                self._refill()
+                wait = 0.0
+                if self.requests_per_minute and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+                if self.tokens_per_minute and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+                if wait == 0.0:
+                    if self.requests_per_minute:
+                        self._requests -= 1
+                    if self.tokens_per_minute:
+                        self._tokens -= tokens
+                    return
+            self._sleep(wait)
+
+
+class EmbeddingScheduler:
+    """Embeds texts in batches on a thread pool, within rate limits, preserving input order.
+
+    ``embed_batch`` is any callable mapping a list of texts to a list of
+    vectors: an API client, a local fake server, or ``hash_embed``. When an
+    ``EmbeddingCache`` is given, cached texts are answered from it and only
+    the misses are sent to ``embed_batch``.
+    """
+
+    def __init__(
+        self,
+        embed_batch,
+        batch_size=None,
+        max_concurrency=None,
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        max_retries=None,
+        backoff_seconds=1.0,
+        max_backoff_seconds=60.0,
+        sleep=time.sleep,
+        cache=None,
+        model_name=None,
+    ):
+        self.embed_batch = embed_batch
+        self.cache = cache
+        self.model_name = model_name or embed_model_name()
+        self.batch_size = batch_size or config.EMBED_BATCH_SIZE
+        self.max_concurrency = max_concurrency or config.EMBED_CONCURRENCY
+        self.max_retries = config.EMBED_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._sleep = sleep
+        self.limiter = RateLimiter(
+            config.EMBED_REQUESTS_PER_MINUTE if requests_per_minute is None else requests_per_minute,
+            config.EMBED_TOKENS_PER_MINUTE if tokens_per_minute is None else tokens_per_minute,
+            sleep=sleep,
+        )
+
+    def _embed_with_retry(self, batch):
+        tokens = sum(estimate_tokens(text) for text in batch)
+        attempt = 0
+        while True:
+            self.limiter.acquire(tokens)
+            try:
+                vectors = self.embed_batch(batch)
+                if len(vectors) != len(batch):
+                    raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+                return vectors
+            except Exception:
+                if attempt >= self.max_retries:
+                    raise
+                # Full jitter keeps concurrent workers from retrying in lockstep
+                self._sleep(random.uniform(0, min(self.max_backoff_seconds, self.backoff_seconds * 2 ** attempt)))
+                attempt += 1
+
+    def embed(self, texts):
+        """Returns one embedding per text, in the order the texts were given."""
+        texts = list(texts)
+        if self.cache is None:
+            return self._embed_uncached(texts)
+
+        vectors = [None] * len(texts)
+        try:
+            for position, vector in self.cache.get_many(self.model_name, texts).items():
+                vectors[position] = vector
+        except sqlite3.Error:
+            pass  # A broken cache only costs the API calls it would have saved
+        missing = [position for position, vector in enumerate(vectors) if vector is None]
+        record_cache("embedding", "hit", len(texts) - len(missing))
+        record_cache("embedding", "miss", len(missing))
+        if missing:
+            missing_texts = [texts[position] for position in missing]
+            fresh = self._embed_uncached(missing_texts)
+            for position, vector in zip(missing, fresh):
+                vectors[position] = vector
+            try:
+                self.cache.put_many(self.model_name, missing_texts, fresh)
+            except sqlite3.Error:
+                pass
+        return vectors
+
+    def _embed_uncached(self, texts):
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1 or self.max_concurrency <= 1:
+            results = [self._embed_with_retry(batch) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+                results = list(executor.map(self._embed_with_retry, batches))
+        return [vector for batch in results for vector in batch]
+
+
+def hash_embed(texts, dim=None):
+    """Deterministic bag-of-words embeddings for offline runs and tests."""
+    dim = dim or config.HASH_EMBED_DIM
+    vectors = []
+    for text in texts:
+        vector = [0.0] * dim
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        vectors.append([value / norm for value in vector])
+    return vectors
+
+
+class ScheduledEmbedding(BaseEmbedding):
+    """llama_index embedding model that sends every batch through an EmbeddingScheduler."""
+
+    _scheduler = PrivateAttr()
+
+    def __init__(self, scheduler, model_name, **kwargs):
+        # Hand llama_index's batches to the scheduler whole so it can fan them out
+        kwargs.setdefault("embed_batch_size", min(2048, scheduler.batch_size * scheduler.max_concurrency * 4))
+        super().__init__(model_name=model_name, **kwargs)
+        self._scheduler = scheduler
+
+    @classmethod
+    def class_name(cls):
+        return "ScheduledEmbedding"
+
+    def _get_query_embedding(self, query):
+        return self._scheduler.embed([query])[0]
+
+    def _get_text_embedding(self, text):
+        return self._scheduler.embed([text])[0]
+
+    def _get_text_embeddings(self, texts):
+        return self._scheduler.embed(texts)
+
+    async def _aget_query_embedding(self, query):
+        return await asyncio.to_thread(self._get_query_embedding, query)
+
+    async def _aget_text_embedding(self, text):
+        return await asyncio.to_thread(self._get_text_embedding, text)
+
+    async def _aget_text_embeddings(self, texts):
+        return await asyncio.to_thread(self._get_text_embeddings, texts)
+
+
+def embed_model_name():
+    """Returns the name that identifies the configured embedder in cache keys."""
+    if config.EMBED_BACKEND == "hash":
+        return f"hash-{config.HASH_EMBED_DIM}"
+    return config.EMBED_MODEL
+
+
+def build_scheduler():
+    """Returns an EmbeddingScheduler for the configured embedding backend."""
+    if config.EMBED_BACKEND == "hash":
+        return EmbeddingScheduler(
+            partial(hash_embed, dim=config.HASH_EMBED_DIM), requests_per_minute=0, tokens_per_minute=0, cache=shared_cache()
+        )
+
+    from llama_index.embeddings.openai import OpenAIEmbedding
+
+    # Retries are handled by the scheduler, one request per batch
+    client = OpenAIEmbedding(model=config.EMBED_MODEL, embed_batch_size=config.EMBED_BATCH_SIZE, max_retries=0)
+    return EmbeddingScheduler(client.get_text_embedding_batch, cache=shared_cache())
+
+
+def build_embed_model():
+    """Returns the configured embedding model wrapped in the batching scheduler."""
+    return ScheduledEmbedding(build_scheduler(), model_name=embed_model_name())
+
+
+def shared_embed_model():
+    """Returns the process-wide embedding model, which the warm-up thread builds ahead of time."""
+    return shared_resource("embed_model", build_embed_model)
@@ -0,0 +1,156 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack, contextmanager
+
+import pdfplumber
+
+import config
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(max_workers):
+    """Returns the shared extraction pool, recreating it if the size changed."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            # spawn, not fork: the Streamlit server is multi-threaded
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = max_workers
+        return _pool
+
+
+def _discard_pool():
+    """Drops a broken pool so the next call starts a fresh one."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+        _pool_workers = 0
+
+
+def _extract_page_range(pdf_path, start, stop):
+    """Extracts the text of pages [start, stop) of a PDF. Runs in a worker process."""
+    with pdfplumber.open(pdf_path) as pdf:
+        return [pdf.pages[n].extract_text() or "" for n in range(start, stop)]
+
+
+def _page_count(pdf_path):
+    with pdfplumber.open(pdf_path) as pdf:
+        return len(pdf.pages)
+
+
+@contextmanager
+def _local_path(file):
+    """Yields a filesystem path for an uploaded file or a path on disk."""
+    if isinstance(file, (str, os.PathLike)):
+        yield str(file)
+        return
+    fd, temp_path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        file.seek(0)
+        with os.fdopen(fd, "wb") as handle:
+            shutil.copyfileobj(file, handle)
+        file.seek(0)
+        yield temp_path
+    finally:
+        os.remove(temp_path)
+
+
+def worker_count(max_workers=None):
+    """Caps the requested number of extraction workers at the CPU count."""
+    requested = config.EXTRACT_WORKERS if max_workers is None else max_workers
+    return max(1, min(requested, os.cpu_count() or 1))
+
+
+def extract_pages(files, max_workers=None):
+    """Extracts page text from PDFs, spreading pages across a process pool.
+
+    Returns one list per input file of ``(page_number, text)`` tuples in page
+    order, with 1-based page numbers. Falls back to extracting serially when
+    only one worker is allowed, when there is a single task, or when the
+    process pool cannot be used.
+    """
+    workers = worker_count(max_workers)
+    step = max(1, config.EXTRACT_PAGES_PER_TASK)
+
+    with ExitStack() as stack:
+        paths = [stack.enter_context(_local_path(file)) for file in files]
+        tasks = []
+        for file_index, pdf_path in enumerate(paths):
+            page_count = _page_count(pdf_path)
+            for start in range(0, page_count, step):
+                tasks.append((file_index, pdf_path, start, min(start + step, page_count)))
+
+        chunks = None
+        if workers > 1 and len(tasks) > 1:
+            try:
+                pool = _get_pool(workers)
+                futures = [pool.submit(_extract_page_range, pdf_path, start, stop) for _, pdf_path, start, stop in tasks]
+                chunks = [future.result() for future in futures]
+            except (BrokenProcessPool, OSError):
+                _discard_pool()
+        if chunks is None:
+            chunks = [_extract_page_range(pdf_path, start, stop) for _, pdf_path, start, stop in tasks]
+
+    results = [[] for _ in files]
+    for (file_index, _, start, _), texts in zip(tasks, chunks):
+        results[file_index].extend(enumerate(texts, start=start + 1))
+    return results
+
+
+def iter_pages(file, max_workers=None):
+    """Yields ``(page_number, text)`` for one PDF in page order.
+
+    Unlike ``extract_pages`` this never holds the whole document: at most two
+    page runs per worker are extracted ahead of the consumer, so a slow
+    downstream stage (chunking, embedding) throttles extraction.
+    """
+    workers = worker_count(max_workers)
+    step = max(1, config.EXTRACT_PAGES_PER_TASK)
+
+    with _local_path(file) as pdf_path:
+        page_count = _page_count(pdf_path)
+        runs = deque((start, min(start + step, page_count)) for start in range(0, page_count, step))
+
+        pending = deque()
+        if workers > 1 and len(runs) > 1:
+            try:
+                pool = _get_pool(workers)
+                while runs and len(pending) < workers * 2:
+                    start, stop = runs.popleft()
+                    pending.append((start, stop, pool.submit(_extract_page_range, pdf_path, start, stop)))
+            except (BrokenProcessPool, OSError):
+                _discard_pool()
+
+        while pending:
+            start, stop, future = pending.popleft()
+            try:
+                texts = future.result()
+            except (BrokenProcessPool, OSError):
+                # Put the unfinished runs back and finish serially
+                _discard_pool()
+                runs.extendleft(reversed([(start, stop)] + [(s, e) for s, e, _ in pending]))
+                pending.clear()
+                break
+            if runs:
+                next_start, next_stop = runs.popleft()
+                try:
+                    pending.append((next_start, next_stop, pool.submit(_extract_page_range, pdf_path, next_start, next_stop)))
+                except (BrokenProcessPool, RuntimeError):
+                    runs.appendleft((next_start, next_stop))
+            yield from enumerate(texts, start=start + 1)
+
+        for start, stop in runs:
+            yield from enumerate(_extract_page_range(pdf_path, start, stop), start=start + 1)
@@ -0,0 +1,114 @@
+import threading
+from collections import OrderedDict
+
+from llama_index.core.chat_engine import CondenseQuestionChatEngine
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore
+
+import config
+from bm25_index import BM25Index
+from chat_memory import RollingSummaryMemory
+from context_budget import build_context_budget
+from index_cache import load_bm25
+
+# A handful of corpora at most are live at once; older BM25 indexes are dropped
+MAX_SHARED_BM25 = 8
+
+_shared_bm25 = OrderedDict()
+_shared_lock = threading.Lock()
+
+
+def reciprocal_rank_fusion(rankings, k=None):
+    """Fuses ranked ID lists into ``[(id, score), ...]`` sorted by summed ``1 / (k + rank)``."""
+    k = config.RRF_K if k is None else k
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def shared_bm25(index, corpus_key=None):
+    """Returns the BM25 index for a corpus, loading it once per process."""
+    if corpus_key is None:
+        return BM25Index.from_nodes(index.docstore.docs.values())
+    with _shared_lock:
+        bm25 = _shared_bm25.get(corpus_key)
+        if bm25 is None:
+            bm25 = load_bm25(corpus_key, index)
+            _shared_bm25[corpus_key] = bm25
+            while len(_shared_bm25) > MAX_SHARED_BM25:
+                _shared_bm25.popitem(last=False)
+        _shared_bm25.move_to_end(corpus_key)
+        return bm25
+
+
+class HybridRetriever(BaseRetriever):
+    """Retrieves with vector search and BM25 and merges both by reciprocal rank fusion.
+
+    Exact terms such as part numbers or clause IDs rank well under BM25 even
+    when their embeddings are close to unrelated chunks, so the fused list
+    is precise enough to keep ``top_k`` small.
+    """
+
+    def __init__(self, index, bm25, top_k=None, candidates=None, rrf_k=None):
+        super().__init__(callback_manager=index.service_context.callback_manager)
+        self._top_k = top_k or config.HYBRID_TOP_K
+        self._candidates = max(candidates or config.HYBRID_CANDIDATES, self._top_k)
+        self._rrf_k = rrf_k
+        self._bm25 = bm25
+        self._docstore = index.docstore
+        self._vector_retriever = index.as_retriever(similarity_top_k=self._candidates)
+
+    def _retrieve(self, query_bundle):
+        vector_hits = self._vector_retriever.retrieve(query_bundle)
+        keyword_hits = self._bm25.search(query_bundle.query_str, self._candidates)
+        fused = reciprocal_rank_fusion(
+            [[hit.node.node_id for hit in vector_hits], [node_id for node_id, _ in keyword_hits]],
+            self._rrf_k,
+        )[:self._top_k]
+
+        nodes = {hit.node.node_id: hit.node for hit in vector_hits}
+        missing = [node_id for node_id, _ in fused if node_id not in nodes]
+        for node in self._docstore.get_nodes(missing, raise_error=False):
+            if node is not None:
+                nodes[node.node_id] = node
+        return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in fused if node_id in nodes]
+
+
+def build_query_engine(index, corpus_key=None, streaming=False):
+    """Returns a query engine over the hybrid retriever, or the plain vector one if disabled.
+
+    With a context token budget, CONTEXT_CANDIDATES chunks are retrieved and
+    the ContextBudget postprocessor picks what the prompt can hold.
+    """
+    budget = build_context_budget(index.service_context)
+    postprocessors = [budget] if budget is not None else []
+    top_k = config.CONTEXT_CANDIDATES if budget is not None else None
+    if not config.HYBRID_RETRIEVAL:
+        return index.as_query_engine(
+            streaming=streaming, similarity_top_k=top_k or config.HYBRID_TOP_K, node_postprocessors=postprocessors
+        )
+    retriever = HybridRetriever(index, shared_bm25(index, corpus_key), top_k=top_k)
+    return RetrieverQueryEngine.from_args(
+        retriever, service_context=index.service_context, streaming=streaming, node_postprocessors=postprocessors
+    )
+
+
+def build_chat_engine(index, corpus_key=None, memory_tokens=None, summary_tokens=None):
+    """Returns a condense_question chat engine that answers through build_query_engine.
+
+    Its memory keeps about ``memory_tokens`` of recent turns plus a rolling
+    summary of about ``summary_tokens``; both default to the config values.
+    """
+    memory = RollingSummaryMemory.from_defaults(
+        llm=index.service_context.llm, token_limit=memory_tokens, summary_token_limit=summary_tokens
+    )
+    # build_query_engine falls back to vector search itself, keeping the context budget either way
+    return CondenseQuestionChatEngine.from_defaults(
+        query_engine=build_query_engine(index, corpus_key),
+        memory=memory,
+        service_context=index.service_context,
+        verbose=True,
+    )
@@ -0,0 +1,416 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from llama_index.core import (
+    Document,
+    ServiceContext,
+    StorageContext,
+    VectorStoreIndex,
+    load_index_from_storage,
+)
+
+import config
+from bm25_index import BM25Index
+from boilerplate import StripStats, boilerplate_settings, strip_boilerplate
+from cache_eviction import prune_cache, touch
+from dedupe import DedupeStats, MinHashDeduper, dedupe_settings
+from embeddings import embed_model_name, shared_embed_model
+from extraction import iter_pages
+from numpy_vector_store import NumpyVectorStore
+from tracing import callback_manager, current_span, record_cache, span
+
+INDEX_ID = "pdf_index"
+MANIFEST_NAME = "manifest.json"
+# Metadata listing the other file pages a deduplicated chunk appeared on
+ALSO_IN = "also_in"
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_digest(file):
+    """Returns the SHA-256 hex digest of an uploaded file or a path on disk.
+
+    Uploads carrying a ``sha256`` attribute (see chat_ui.hash_uploads) are
+    not read again.
+    """
+    digest = getattr(file, "sha256", None)
+    if digest:
+        return digest
+    sha = hashlib.sha256()
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as handle:
+            for block in iter(lambda: handle.read(HASH_BLOCK_SIZE), b""):
+                sha.update(block)
+    else:
+        file.seek(0)
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            sha.update(block)
+        file.seek(0)
+    return sha.hexdigest()
+
+
+def file_name(file):
+    """Returns the display name of an uploaded file or a path on disk."""
+    if isinstance(file, (str, os.PathLike)):
+        return Path(file).name
+    return file.name
+
+
+def settings_fingerprint():
+    """Returns the chunking and embedding settings that shape an index."""
+    return {
+        "chunk_size": config.CHUNK_SIZE,
+        "chunk_overlap": config.CHUNK_OVERLAP,
+        "embed_model": embed_model_name(),
+        "boilerplate": boilerplate_settings(),
+        "dedupe": dedupe_settings(),
+    }
+
+
+def corpus_key(files):
+    """Hashes the uploaded file bytes plus the index settings into a cache key."""
+    digests = sorted(file_digest(file) for file in files)
+    payload = json.dumps({"files": digests, "settings": settings_fingerprint()}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_dir(key):
+    """Returns the on-disk directory for a cached index."""
+    return Path(config.CACHE_ROOT) / key
+
+
+def new_storage_context():
+    """Returns an empty StorageContext backed by the configured vector store."""
+    if config.VECTOR_STORE == "numpy":
+        return StorageContext.from_defaults(vector_store=NumpyVectorStore())
+    return StorageContext.from_defaults()
+
+
+def load_cached_index(key, service_context):
+    """Loads a previously persisted index, or returns None on a cache miss."""
+    storage_dir = cache_dir(key)
+    if not (storage_dir / "docstore.json").exists():
+        return None
+    touch(storage_dir)
+    vector_store = None
+    if NumpyVectorStore.exists(storage_dir):
+        vector_store = NumpyVectorStore.from_persist_dir(storage_dir)
+    storage_context = StorageContext.from_defaults(persist_dir=str(storage_dir), vector_store=vector_store)
+    return load_index_from_storage(storage_context, index_id=INDEX_ID, service_context=service_context)
+
+
+def load_manifest(key):
+    """Returns the per-file manifest stored next to a cached index."""
+    manifest_path = cache_dir(key) / MANIFEST_NAME
+    if not manifest_path.exists():
+        return {}
+    with open(manifest_path, "r", encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def manifest_savings(manifest, stage):
+    """Sums the characters and estimated tokens a stage ("boilerplate" or "dedupe") kept out of a manifest's index."""
+    chars = sum(entry.get(stage, {}).get("chars", 0) for entry in manifest.values())
+    tokens = sum(entry.get(stage, {}).get("tokens", 0) for entry in manifest.values())
+    return chars, tokens
+
+
+def load_bm25(key, index):
+    """Loads the BM25 index persisted under ``key``, rebuilding it from the docstore if missing."""
+    storage_dir = cache_dir(key)
+    if BM25Index.exists(storage_dir):
+        return BM25Index.from_persist_dir(storage_dir)
+    return BM25Index.from_nodes(index.docstore.docs.values())
+
+
+def load_dedupe(key, index):
+    """Loads the chunk deduper persisted under ``key``, rebuilding it from the docstore if missing."""
+    storage_dir = cache_dir(key)
+    if MinHashDeduper.exists(storage_dir):
+        return MinHashDeduper.from_persist_dir(storage_dir)
+    return MinHashDeduper.from_nodes(index.docstore.docs.values())
+
+
+def persist_index(index, key, manifest=None, bm25=None, dedupe=None):
+    """Persists an index with its manifest, BM25 index and deduper under the cache key and returns the storage directory."""
+    storage_dir = cache_dir(key)
+    storage_dir.parent.mkdir(parents=True, exist_ok=True)
+    # Write into a sibling temp dir first so a crashed run never leaves a
+    # half-written index that later looks like a cache hit.
+    staging_dir = Path(tempfile.mkdtemp(dir=storage_dir.parent, prefix=f".{key}-"))
+    try:
+        index.set_index_id(INDEX_ID)
+        index.storage_context.persist(persist_dir=str(staging_dir))
+        if manifest is not None:
+            with open(staging_dir / MANIFEST_NAME, "w", encoding="utf-8") as handle:
+                json.dump(manifest, handle, indent=2, sort_keys=True)
+        if bm25 is not None:
+            bm25.persist(staging_dir)
+        if dedupe is not None:
+            dedupe.persist(staging_dir)
+        if storage_dir.exists():
+            shutil.rmtree(storage_dir)
+        os.replace(staging_dir, storage_dir)
+    finally:
+        if staging_dir.exists():
+            shutil.rmtree(staging_dir)
+    return storage_dir
+
+
+def build_service_context(llm):
+    """Creates a ServiceContext with the configured chunking and the shared embedding model."""
+    return ServiceContext.from_defaults(
+        llm=llm,
+        chunk_size=config.CHUNK_SIZE,
+        chunk_overlap=config.CHUNK_OVERLAP,
+        embed_model=shared_embed_model(),
+        callback_manager=callback_manager(),
+    )
+
+
+def page_document(name, digest, page_number, text):
+    """Returns the Document for one page of a file."""
+    return Document(
+        text=text,
+        doc_id=f"{digest}-p{page_number}",
+        metadata={"file_name": name, "page_label": str(page_number)},
+        # Embed the text alone so the embedding cache also hits on renamed or re-paginated copies
+        excluded_embed_metadata_keys=["file_name", "page_label"],
+    )
+
+
+def iter_page_documents(file, digest, stats=None):
+    """Yields one Document per non-empty page, streamed from the extraction pool.
+
+    Repeated headers, footers and page numbers are stripped first unless
+    disabled; ``stats`` collects what that removed.
+    """
+    name = file_name(file)
+    pages = iter_pages(file)
+    if config.STRIP_BOILERPLATE:
+        pages = strip_boilerplate(pages, stats)
+    for page_number, text in pages:
+        if text.strip():
+            yield page_document(name, digest, page_number, text)
+
+
+def iter_node_batches(documents, node_parser, batch_size=None, memory_limit_mb=None):
+    """Chunks documents lazily and groups the nodes into bounded batches.
+
+    A batch is yielded once it holds ``batch_size`` nodes or its text reaches
+    ``memory_limit_mb``, whichever comes first. Because every stage is a
+    generator, the next page is not extracted until the consumer has
+    embedded and stored the previous batch.
+    """
+    batch_size = batch_size or config.INGEST_BATCH_SIZE
+    max_bytes = int((memory_limit_mb or config.INGEST_MEMORY_LIMIT_MB) * 1024 * 1024)
+    batch, batch_bytes = [], 0
+    for document in documents:
+        for node in node_parser.get_nodes_from_documents([document]):
+            batch.append(node)
+            batch_bytes += len(node.get_content().encode("utf-8"))
+            if len(batch) >= batch_size or batch_bytes >= max_bytes:
+                yield batch
+                batch, batch_bytes = [], 0
+    if batch:
+        yield batch
+
+
+def _report(progress, stage, **counts):
+    if progress is not None:
+        progress(stage, **counts)
+
+
+def _counted_pages(documents, progress):
+    for document in documents:
+        _report(progress, "extracting", pages=1)
+        yield document
+
+
+def _source(node):
+    return [node.metadata.get("file_name", ""), node.metadata.get("page_label", "")]
+
+
+def _label(name, page_label):
+    return f"{name} p.{page_label}" if page_label else name
+
+
+def collapse_duplicates(nodes, dedupe, duplicate_of, stats=None):
+    """Returns the nodes that are not near-duplicates of stored ones.
+
+    Each duplicate is recorded as its ``[file_name, page_label]`` under the
+    stored node it matched in ``duplicate_of``, instead of being embedded.
+    Unique nodes are added to ``dedupe`` so later chunks can match them.
+    """
+    unique = []
+    for node in nodes:
+        signature = dedupe.signature(node.get_content())
+        canonical, _ = dedupe.match(signature=signature)
+        if stats is not None:
+            stats.count(node, canonical is not None)
+        if canonical is None:
+            dedupe.add(node.node_id, signature=signature)
+            unique.append(node)
+        else:
+            duplicate_of.setdefault(canonical, []).append(_source(node))
+    return unique
+
+
+def _refresh_sources(index, manifest, node_ids):
+    """Rewrites the ALSO_IN metadata of stored nodes from the duplicates recorded in the manifest."""
+    sources = {}
+    for entry in manifest.values():
+        for node_id, refs in entry.get("duplicate_of", {}).items():
+            sources.setdefault(node_id, []).extend(refs)
+    nodes = [node for node in index.docstore.get_nodes(list(node_ids), raise_error=False) if node is not None]
+    for node in nodes:
+        own = _label(*_source(node))
+        labels = [label for label in dict.fromkeys(_label(*ref) for ref in sources.get(node.node_id, [])) if label != own]
+        if labels:
+            node.metadata[ALSO_IN] = labels
+            if ALSO_IN not in node.excluded_embed_metadata_keys:
+                node.excluded_embed_metadata_keys.append(ALSO_IN)
+        else:
+            node.metadata.pop(ALSO_IN, None)
+    index.docstore.add_documents(nodes, allow_update=True)
+
+
+def _delete_nodes(index, node_ids):
+    index.delete_nodes(node_ids, delete_from_docstore=True)
+    for node_id in node_ids:
+        index.index_struct.nodes_dict.pop(node_id, None)
+    index.storage_context.index_store.add_index_struct(index.index_struct)
+
+
+def _remove_file(index, manifest, entry, bm25=None, dedupe=None):
+    """Deletes a removed file's nodes; ones that other files duplicated are handed to the first of them.
+
+    The adopting file's first duplicate reference becomes the node's own
+    file and page, so citations never point at a file that is gone.
+    """
+    owned = set(entry["node_ids"])
+    adopted = {}
+    for digest, other in list(manifest.items()):
+        claimed = [node_id for node_id in other.get("duplicate_of", {}) if node_id in owned and node_id not in adopted]
+        if not claimed:
+            continue
+        other = manifest[digest] = dict(other, node_ids=list(other["node_ids"]), duplicate_of=dict(other["duplicate_of"]))
+        for node_id in claimed:
+            refs = other["duplicate_of"].pop(node_id)
+            if refs[1:]:
+                other["duplicate_of"][node_id] = refs[1:]
+            other["node_ids"].append(node_id)
+            adopted[node_id] = refs[0]
+
+    deleted = [node_id for node_id in entry["node_ids"] if node_id not in adopted]
+    _delete_nodes(index, deleted)
+    if bm25 is not None:
+        bm25.remove_nodes(deleted)
+    if dedupe is not None:
+        dedupe.remove_nodes(deleted)
+
+    for node in index.docstore.get_nodes(list(adopted), raise_error=False):
+        if node is not None:
+            node.metadata["file_name"], node.metadata["page_label"] = adopted[node.node_id]
+            index.docstore.add_documents([node], allow_update=True)
+    _refresh_sources(index, manifest, set(adopted) | set(entry.get("duplicate_of", {})))
+
+
+def sync_index(index, manifest, files, service_context, bm25=None, progress=None, dedupe=None):
+    """Inserts nodes for newly added files and deletes nodes of removed ones.
+
+    The manifest maps each file's SHA-256 to the document and node IDs it
+    contributed, so only the difference between the indexed set and
+    ``files`` is embedded or deleted. ``bm25`` is kept in step with the
+    vector index when given. With ``dedupe``, chunks that nearly duplicate
+    a stored one are not embedded; the stored node lists their pages under
+    ALSO_IN instead. ``progress(stage, **counts)`` is called as pages are
+    extracted, chunks embedded and files finished. Each entry also records
+    what boilerplate stripping and dedupe removed from the file. Returns
+    the updated manifest.
+    """
+    manifest = dict(manifest)
+    current = {file_digest(file): file for file in files}
+
+    for digest in set(manifest) - set(current):
+        _remove_file(index, manifest, manifest.pop(digest), bm25, dedupe)
+
+    for digest, file in current.items():
+        if digest in manifest:
+            _report(progress, "indexing", files=1)
+            continue
+        ref_doc_ids, node_ids, duplicate_of = [], [], {}
+        stripped, deduped = StripStats(), DedupeStats()
+        documents = _counted_pages(iter_page_documents(file, digest, stripped), progress)
+        for nodes in iter_node_batches(documents, service_context.node_parser):
+            if dedupe is not None:
+                nodes = collapse_duplicates(nodes, dedupe, duplicate_of, deduped)
+                if not nodes:
+                    continue
+            index.insert_nodes(nodes)
+            if bm25 is not None:
+                bm25.add_nodes(nodes)
+            _report(progress, "embedding", chunks=len(nodes))
+            for node in nodes:
+                if node.ref_doc_id not in ref_doc_ids[-1:]:
+                    ref_doc_ids.append(node.ref_doc_id)
+                node_ids.append(node.node_id)
+        manifest[digest] = {
+            "name": file_name(file),
+            "ref_doc_ids": ref_doc_ids,
+            "node_ids": node_ids,
+            "duplicate_of": duplicate_of,
+            "boilerplate": stripped.to_dict(),
+            "dedupe": deduped.to_dict(),
+        }
+        if duplicate_of:
+            _refresh_sources(index, manifest, duplicate_of)
+        traced = current_span()
+        if traced is not None:
+            traced.add(boilerplate_chars=stripped.chars, boilerplate_tokens=stripped.tokens)
+            traced.add(duplicate_chunks=deduped.duplicates, duplicate_tokens=deduped.tokens)
+        _report(progress, "indexing", files=1)
+    return manifest
+
+
+def build_index(files, key, service_context, base_key=None, progress=None):
+    """Returns the index for ``files``, embedding only what is not cached yet.
+
+    A cache hit on ``key`` is loaded as is. Otherwise the index persisted
+    under ``base_key`` (typically the previous upload set) is reloaded and
+    brought up to date file by file, then persisted under ``key``.
+    ``progress`` is passed on to sync_index and also told when persisting.
+    """
+    with span("build_index", files=len(files)) as current:
+        _report(progress, "loading")
+        with span("load_index"):
+            index = load_cached_index(key, service_context)
+        if index is not None:
+            record_cache("index", "hit")
+            return index
+        record_cache("index", "miss")
+
+        manifest = load_manifest(base_key) if base_key is not None else {}
+        if manifest:
+            with span("load_base_index"):
+                index = load_cached_index(base_key, service_context)
+        if index is None:
+            index = VectorStoreIndex([], service_context=service_context, storage_context=new_storage_context())
+            manifest, bm25 = {}, BM25Index()
+            dedupe = MinHashDeduper() if config.DEDUPE_CHUNKS else None
+        else:
+            bm25 = load_bm25(base_key, index)
+            dedupe = load_dedupe(base_key, index) if config.DEDUPE_CHUNKS else None
+
+        with span("sync_index"):
+            manifest = sync_index(index, manifest, files, service_context, bm25, progress, dedupe)
+        _report(progress, "persisting")
+        with span("persist_index"):
+            persist_index(index, key, manifest, bm25, dedupe)
+        prune_cache(keep={key, base_key})
+        if current is not None:
+            current.set(nodes=len(index.docstore.docs))
+        return index
@@ -0,0 +1,158 @@
+import threading
+import weakref
+from collections import OrderedDict
+
+import config
+from numpy_vector_store import NumpyVectorStore
+
+LEASE_KEY = "index_lease"
+
+_shared_registry = None
+_shared_lock = threading.Lock()
+
+
+def estimate_index_bytes(index):
+    """Roughly estimates the RAM an index holds: embeddings plus node text."""
+    vector_store = index.vector_store
+    if isinstance(vector_store, NumpyVectorStore):
+        # Persisted rows are memory-mapped, but count them since they end up in the page cache
+        vector_bytes = vector_store.nbytes
+    else:
+        embeddings = getattr(getattr(vector_store, "data", None), "embedding_dict", {})
+        # Python floats in lists cost about 32 bytes each
+        vector_bytes = sum(len(vector) for vector in embeddings.values()) * 32
+    text_bytes = sum(len(node.get_content()) for node in index.docstore.docs.values())
+    return vector_bytes + text_bytes
+
+
+class _Entry:
+    def __init__(self, key):
+        self.key = key
+        self.index = None
+        self.error = None
+        self.size = 0
+        self.refs = 0
+        self.ready = threading.Event()
+
+
+class IndexLease:
+    """A session's hold on a shared index; released explicitly or when garbage-collected."""
+
+    def __init__(self, registry, entry):
+        self.key = entry.key
+        self.index = entry.index
+        self._finalizer = weakref.finalize(self, registry._release, entry)
+
+    def release(self):
+        self._finalizer()
+
+
+class IndexRegistry:
+    """Process-wide indexes keyed by corpus content hash, shared by every session.
+
+    The first session to ask for a key builds the index while concurrent
+    requests for the same key wait for that single build. Each lease counts
+    as a reference; indexes nobody holds stay cached until the estimated
+    total exceeds ``max_bytes`` and are then evicted least recently used
+    first. Indexes in use are never evicted.
+    """
+
+    def __init__(self, max_bytes=None, sizer=estimate_index_bytes):
+        self.max_bytes = int(config.INDEX_REGISTRY_MAX_MB * 1024 * 1024) if max_bytes is None else max_bytes
+        self._sizer = sizer
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # corpus key -> _Entry, least recently used first
+        self.builds = 0
+
+    def lease(self, key, build):
+        """Returns an IndexLease for ``key``, calling ``build()`` only if no session has loaded it."""
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = _Entry(key)
+            entry.refs += 1  # Held from the start so a finished build is not evicted under us
+            self._entries.move_to_end(key)
+
+        if owner:
+            try:
+                index = build()
+                size = self._sizer(index)
+            except BaseException as e:
+                with self._lock:
+                    entry.error = e
+                    if self._entries.get(key) is entry:
+                        del self._entries[key]
+                entry.ready.set()
+                raise
+            with self._lock:
+                entry.index, entry.size = index, size
+                self.builds += 1
+                entry.ready.set()
+                self._evict()
+        else:
+            entry.ready.wait()
+            if entry.error is not None:
+                raise entry.error
+        return IndexLease(self, entry)
+
+    def contains(self, key):
+        """Returns whether a built index for ``key`` is loaded right now."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry.ready.is_set() and entry.error is None
+
+    def keys(self):
+        """Returns the corpus keys with an index loaded or being built."""
+        with self._lock:
+            return list(self._entries)
+
+    def _release(self, entry):
+        with self._lock:
+            entry.refs -= 1
+            if self._entries.get(entry.key) is entry:
+                self._evict()
+
+    def _evict(self):
+        total = sum(entry.size for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            entry = self._entries[key]
+            if entry.refs <= 0 and entry.ready.is_set():
+                del self._entries[key]
+                total -= entry.size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "indexes": len(self._entries),
+                "bytes": sum(entry.size for entry in self._entries.values()),
+                "leases": sum(entry.refs for entry in self._entries.values()),
+                "builds": self.builds,
+            }
+
+
+def shared_registry():
+    """Returns the process-wide index registry."""
+    global _shared_registry
+    with _shared_lock:
+        if _shared_registry is None:
+            _shared_registry = IndexRegistry()
+        return _shared_registry
+
+
+def session_index(session, key, build):
+    """Leases the shared index for ``key`` into a session, releasing the one it held before.
+
+    ``session`` is any dict-like per-user store such as ``st.session_state``;
+    the lease lives there, so it is dropped along with the session.
+    """
+    lease = session.get(LEASE_KEY)
+    if lease is not None and lease.key == key:
+        return lease.index
+    new_lease = shared_registry().lease(key, build)
+    if lease is not None:
+        lease.release()
+    session[LEASE_KEY] = new_lease
+    return new_lease.index
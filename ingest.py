@@ -0,0 +1,146 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from llama_index.core.llms import MockLLM
+
+import config
+from index_cache import (
+    build_index,
+    build_service_context,
+    cache_dir,
+    corpus_key,
+    load_manifest,
+    manifest_savings,
+    settings_fingerprint,
+)
+from library import library_path
+
+GROUPINGS = ("file", "directory", "tree")
+
+
+def find_pdfs(root):
+    """Returns every PDF under ``root``, sorted by path."""
+    return sorted(path for path in Path(root).rglob("*") if path.is_file() and path.suffix.lower() == ".pdf")
+
+
+def group_pdfs(root, paths, grouping="file"):
+    """Groups PDFs into corpora: one per file, one per directory, or one for the whole tree."""
+    root = Path(root).resolve()
+    corpora = {}
+    for path in paths:
+        path = path.resolve()
+        if grouping == "file":
+            relative = path.relative_to(root)
+        elif grouping == "directory":
+            relative = path.parent.relative_to(root)
+        else:
+            relative = Path(".")
+        # Names start with the root directory so runs over different trees do not collide
+        name = (Path(root.name) / relative).as_posix()
+        corpora.setdefault(name, []).append(path)
+    return corpora
+
+
+def ingest_corpus(name, paths, service_context):
+    """Builds or reuses the cached index for one corpus and returns its library entry."""
+    started = time.perf_counter()
+    entry = {"name": name, "files": [str(path) for path in paths]}
+    try:
+        key = corpus_key(paths)
+        cached = (cache_dir(key) / "docstore.json").exists()
+        if not cached:
+            build_index(paths, key, service_context)
+        manifest = load_manifest(key)
+        stripped_chars, stripped_tokens = manifest_savings(manifest, "boilerplate")
+        duplicate_chars, duplicate_tokens = manifest_savings(manifest, "dedupe")
+        entry.update(
+            key=key,
+            cached=cached,
+            error="",
+            stripped_chars=stripped_chars,
+            stripped_tokens=stripped_tokens,
+            duplicate_chars=duplicate_chars,
+            duplicate_tokens=duplicate_tokens,
+        )
+    except Exception as e:
+        entry.update(key=None, cached=False, error=str(e))
+    entry["seconds"] = round(time.perf_counter() - started, 3)
+    return entry
+
+
+def save_library(entries):
+    """Merges successful ingest results into the library manifest, replacing it atomically."""
+    path = library_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    corpora = {}
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as handle:
+            corpora = json.load(handle).get("corpora", {})
+    for entry in entries:
+        if not entry["error"]:
+            corpora[entry["name"]] = {
+                "key": entry["key"],
+                "files": entry["files"],
+                "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+    handle, temp_path = tempfile.mkstemp(dir=path.parent, prefix=".library-", suffix=".json")
+    with os.fdopen(handle, "w", encoding="utf-8") as out:
+        json.dump({"settings": settings_fingerprint(), "corpora": corpora}, out, indent=2, sort_keys=True)
+    os.replace(temp_path, path)
+    return path
+
+
+def ingest(root, grouping="file", workers=None, log=print):
+    """Indexes every PDF corpus under ``root`` in parallel and updates the library manifest.
+
+    All corpora share one service context, so the embedding rate limits and
+    the embedding cache apply across the whole run. Corpora whose index is
+    already cached are skipped. Returns the ingest results in path order.
+    """
+    corpora = group_pdfs(root, find_pdfs(root), grouping)
+    # The embedder is the only model used here, so no real LLM is configured
+    service_context = build_service_context(MockLLM())
+    workers = max(1, min(workers or config.INGEST_WORKERS, len(corpora) or 1))
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(ingest_corpus, name, paths, service_context): name for name, paths in corpora.items()}
+        for done, future in enumerate(as_completed(futures), start=1):
+            entry = future.result()
+            results[futures[future]] = entry
+            status = "error: " + entry["error"] if entry["error"] else ("cached" if entry["cached"] else "built")
+            if entry.get("stripped_chars"):
+                status += f", {entry['stripped_chars']} boilerplate chars (~{entry['stripped_tokens']} tokens) stripped"
+            if entry.get("duplicate_chars"):
+                status += f", {entry['duplicate_chars']} duplicate chars (~{entry['duplicate_tokens']} tokens) not embedded"
+            log(f"[{done}/{len(futures)}] {entry['name']}: {status} in {entry['seconds']:.1f}s")
+    results = [results[name] for name in corpora]
+    save_library(results)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-build cached indexes for a directory tree of PDFs.")
+    parser.add_argument("root", help="directory to scan for PDFs, recursively")
+    parser.add_argument(
+        "--group",
+        choices=GROUPINGS,
+        default="file",
+        help="index each PDF alone, each directory as one corpus, or the whole tree as one corpus",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="corpora indexed in parallel")
+    args = parser.parse_args()
+
+    results = ingest(args.root, args.group, args.workers)
+    failed = [entry for entry in results if entry["error"]]
+    print(f"{len(results) - len(failed)} corpora ready, {len(failed)} failed; library written to {library_path()}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import config
+from index_cache import build_index, file_name
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+# Finished jobs nobody collected are dropped after this long, releasing their index
+FINISHED_JOB_TTL_SECONDS = 600
+
+_shared_jobs = None
+_shared_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested."""
+
+
+def snapshot_files(files):
+    """Spools uploaded files to a private temporary directory; paths on disk are kept as is.
+
+    A job reads its files on a worker thread while later script runs hash
+    the same uploads, so the two must not share a stream position. Copies go
+    to disk rather than memory so a large upload is not held twice. Returns
+    ``(files, spool_dir)``; ``spool_dir`` is None when nothing was copied.
+    """
+    copies, spool_dir = [], None
+    for position, file in enumerate(files):
+        if isinstance(file, (str, os.PathLike)):
+            copies.append(file)
+            continue
+        if spool_dir is None:
+            root = Path(config.CACHE_ROOT) / "uploads"
+            root.mkdir(parents=True, exist_ok=True)
+            spool_dir = Path(tempfile.mkdtemp(dir=root))
+        # One directory per file keeps the upload's name even when two uploads share it
+        target = spool_dir / str(position) / os.path.basename(file_name(file))
+        target.parent.mkdir()
+        file.seek(0)
+        with open(target, "wb") as handle:
+            shutil.copyfileobj(file, handle)
+        file.seek(0)
+        copies.append(target)
+    return copies, spool_dir
+
+
+class IngestJob:
+    """State of one background ingestion, updated by the worker and polled by the UI."""
+
+    def __init__(self, key, files_total):
+        self.key = key
+        self.status = QUEUED
+        self.stage = QUEUED
+        self.files_total = files_total
+        self.files_done = 0
+        self.pages = 0
+        self.chunks = 0
+        self.error = ""
+        self.index = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def update(self, stage, files=0, pages=0, chunks=0):
+        """Progress callback for build_index; raises JobCancelled once cancel() was called."""
+        if self._cancel.is_set():
+            raise JobCancelled(self.key)
+        with self._lock:
+            self.stage = stage
+            self.files_done += files
+            self.pages += pages
+            self.chunks += chunks
+
+    def cancel(self):
+        """Requests cancellation; a running build stops at its next page or batch."""
+        self._cancel.set()
+
+    def result(self):
+        return self.index
+
+    def _start(self):
+        if self._cancel.is_set():
+            raise JobCancelled(self.key)
+        with self._lock:
+            self.status = RUNNING
+            self.stage = RUNNING
+
+    def _finish(self, status, error=""):
+        with self._lock:
+            self.status = status
+            self.stage = status
+            self.error = error
+            self.finished_at = time.time()
+
+
+class JobManager:
+    """Runs index builds on a worker pool, deduplicated by corpus key.
+
+    Submitting a key that already has a job returns that job, so reruns and
+    other sessions on the same files poll one build instead of starting new
+    ones. Failed or cancelled jobs are only replaced when ``retry`` is set.
+    """
+
+    def __init__(self, max_workers=None):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or config.INGEST_JOB_WORKERS, thread_name_prefix="ingest"
+        )
+        self._lock = threading.Lock()
+        self._jobs = {}  # corpus key -> IngestJob
+
+    def submit(self, key, files, service_context, base_key=None, retry=False):
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(key)
+            if job is not None and not (retry and job.status in (FAILED, CANCELLED)):
+                return job
+            job = self._jobs[key] = IngestJob(key, len(files))
+        copies, spool_dir = snapshot_files(files)
+        self._executor.submit(self._run, job, copies, service_context, base_key, spool_dir)
+        return job
+
+    def get(self, key):
+        with self._lock:
+            return self._jobs.get(key)
+
+    def forget(self, job):
+        """Drops a finished job once its index has been handed over."""
+        with self._lock:
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+
+    def _prune(self):
+        cutoff = time.time() - FINISHED_JOB_TTL_SECONDS
+        for key, job in list(self._jobs.items()):
+            if job.finished and job.finished_at < cutoff:
+                del self._jobs[key]
+
+    def _run(self, job, files, service_context, base_key, spool_dir=None):
+        try:
+            job._start()
+            job.index = build_index(files, job.key, service_context, base_key, job.update)
+            job._finish(DONE)
+        except JobCancelled:
+            job._finish(CANCELLED)
+        except Exception as e:
+            job._finish(FAILED, str(e))
+        finally:
+            if spool_dir is not None:
+                shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+def shared_jobs():
+    """Returns the process-wide ingestion job manager."""
+    global _shared_jobs
+    with _shared_lock:
+        if _shared_jobs is None:
+            _shared_jobs = JobManager()
+        return _shared_jobs
@@ -0,0 +1,26 @@
+import json
+from pathlib import Path
+
+import config
+
+# Kept free of llama_index imports so the apps can list collections on their first paint
+LIBRARY_NAME = "library.json"
+
+
+def library_path():
+    return Path(config.CACHE_ROOT) / LIBRARY_NAME
+
+
+def load_library():
+    """Returns the pre-built corpora by name, skipping entries whose index is gone."""
+    path = library_path()
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as handle:
+        library = json.load(handle)
+    # Same layout as index_cache.cache_dir
+    return {
+        name: entry
+        for name, entry in library.get("corpora", {}).items()
+        if entry.get("key") and (Path(config.CACHE_ROOT) / entry["key"] / "docstore.json").exists()
+    }
@@ -0,0 +1,290 @@
+import json
+import os
+import tempfile
+from collections import defaultdict
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.vector_stores.types import BasePydanticVectorStore, VectorStoreQueryResult
+
+import config
+from ann_index import IVFIndex
+
+MATRIX_SUFFIX = ".npy"
+META_SUFFIX = ".meta.json"
+IVF_SUFFIX = ".ivf.npz"
+DEFAULT_PERSIST_NAME = "default__vector_store"
+COPY_ROWS = 8192
+SPILL_SUFFIX = ".spill"
+
+
+def _paths(persist_path):
+    base = os.path.splitext(str(persist_path))[0]
+    return base + MATRIX_SUFFIX, base + META_SUFFIX, base + IVF_SUFFIX
+
+
+def _unit_vector(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _unit_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """Vector store that keeps embeddings in one contiguous float32 matrix.
+
+    The matrix is persisted as ``<name>.npy`` and reopened with ``np.memmap``,
+    so loading an index neither parses nor copies the vectors; node and
+    document IDs live in ``<name>.meta.json``. Rows are L2-normalised, which
+    makes cosine similarity search a single matrix-vector product. Rows
+    added after loading are kept in memory until they reach
+    ``config.INGEST_MEMORY_LIMIT_MB``, then appended to a temporary spill
+    file under the cache directory and memory-mapped until the next persist.
+    Deleted rows are masked out and dropped on persist.
+
+    Stores of at least ``config.ANN_MIN_ROWS`` rows are persisted grouped by
+    IVF list with their k-means centroids, and queries then probe only the
+    closest lists instead of scanning every row.
+    """
+
+    stores_text: bool = False
+    is_embedding_query: bool = True
+
+    _matrix = PrivateAttr()
+    _pending = PrivateAttr()
+    _spill = PrivateAttr(default=None)
+    _spilled = PrivateAttr(default=None)
+    _node_ids = PrivateAttr()
+    _ref_doc_ids = PrivateAttr()
+    _rows_by_ref = PrivateAttr()
+    _alive = PrivateAttr()
+    _ivf = PrivateAttr()
+
+    def __init__(self, matrix=None, node_ids=None, ref_doc_ids=None, ivf=None, **kwargs):
+        super().__init__(**kwargs)
+        self._reset(matrix, node_ids, ref_doc_ids, ivf)
+
+    def _reset(self, matrix, node_ids, ref_doc_ids, ivf):
+        if self._spill is not None:
+            self._spill.close()  # Deletes the temporary file
+        self._matrix = matrix
+        self._ivf = ivf
+        self._pending = []
+        self._spill = self._spilled = None
+        self._node_ids = list(node_ids or [])
+        self._ref_doc_ids = list(ref_doc_ids or [])
+        self._rows_by_ref = defaultdict(list)
+        for row, ref_doc_id in enumerate(self._ref_doc_ids):
+            self._rows_by_ref[ref_doc_id].append(row)
+        self._alive = np.ones(len(self._node_ids), dtype=bool)
+
+    @classmethod
+    def class_name(cls):
+        return "NumpyVectorStore"
+
+    @property
+    def client(self):
+        return None
+
+    @staticmethod
+    def exists(persist_dir, name=DEFAULT_PERSIST_NAME):
+        """Tells whether ``persist_dir`` holds a persisted NumpyVectorStore."""
+        return os.path.exists(os.path.join(str(persist_dir), name + META_SUFFIX))
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir, name=DEFAULT_PERSIST_NAME):
+        return cls.from_persist_path(os.path.join(str(persist_dir), name + MATRIX_SUFFIX))
+
+    @classmethod
+    def from_persist_path(cls, persist_path):
+        matrix_path, meta_path, ivf_path = _paths(persist_path)
+        with open(meta_path, "r", encoding="utf-8") as handle:
+            meta = json.load(handle)
+        matrix = np.load(matrix_path, mmap_mode="r") if meta["node_ids"] else None
+        ivf = None
+        if matrix is not None and os.path.exists(ivf_path):
+            ivf = IVFIndex.load(ivf_path)
+            if ivf.offsets[-1] != len(matrix):
+                ivf = None  # Stale centroids from an older persist
+        return cls(matrix=matrix, node_ids=meta["node_ids"], ref_doc_ids=meta["ref_doc_ids"], ivf=ivf)
+
+    @property
+    def dim(self):
+        for part in self._parts():
+            return part.shape[1]
+        return 0
+
+    @property
+    def nbytes(self):
+        """Bytes of embedding rows held, memory-mapped or in RAM."""
+        return sum(part.nbytes for part in self._parts())
+
+    def _parts(self):
+        """Yields the persisted (memory-mapped) rows, then the rows added since."""
+        if self._matrix is not None and len(self._matrix):
+            yield self._matrix
+        yield from self._added_parts()
+
+    def _added_parts(self):
+        """Yields the spilled rows, then the ones still in RAM."""
+        if self._spilled is not None:
+            yield self._spilled
+        if self._pending:
+            if len(self._pending) > 1:
+                self._pending = [np.vstack(self._pending)]
+            yield self._pending[0]
+
+    def add(self, nodes, **add_kwargs):
+        if not nodes:
+            return []
+        embeddings = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        if self.dim and embeddings.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {embeddings.shape[1]} does not match the store's {self.dim}")
+        self._pending.append(_unit_rows(embeddings))
+        if sum(part.nbytes for part in self._pending) >= config.INGEST_MEMORY_LIMIT_MB * 1024 * 1024:
+            self._spill_pending()
+        start = len(self._node_ids)
+        for offset, node in enumerate(nodes):
+            self._node_ids.append(node.node_id)
+            self._ref_doc_ids.append(node.ref_doc_id)
+            self._rows_by_ref[node.ref_doc_id].append(start + offset)
+        self._alive = np.concatenate([self._alive, np.ones(len(nodes), dtype=bool)])
+        return [node.node_id for node in nodes]
+
+    def _spill_pending(self):
+        """Appends the in-memory rows to the spill file and maps it in their place."""
+        rows = np.ascontiguousarray(np.vstack(self._pending), dtype=np.float32)
+        if self._spill is None:
+            os.makedirs(config.CACHE_ROOT, exist_ok=True)
+            self._spill = tempfile.TemporaryFile(dir=config.CACHE_ROOT, suffix=SPILL_SUFFIX)
+        self._spill.seek(0, os.SEEK_END)
+        self._spill.write(rows.tobytes())
+        self._spill.flush()
+        count = self._spill.tell() // rows.itemsize // rows.shape[1]
+        self._spilled = np.memmap(self._spill, dtype=np.float32, mode="r", shape=(count, rows.shape[1]))
+        self._pending = []
+
+    def delete(self, ref_doc_id, **delete_kwargs):
+        for row in self._rows_by_ref.pop(ref_doc_id, []):
+            self._alive[row] = False
+
+    def delete_nodes(self, node_ids=None, filters=None, **delete_kwargs):
+        if filters is not None:
+            raise ValueError("NumpyVectorStore does not support metadata filters")
+        node_ids = set(node_ids or ())
+        for row, node_id in enumerate(self._node_ids):
+            if node_id in node_ids:
+                self._alive[row] = False
+
+    def similarities(self, query_embedding):
+        """Returns the cosine similarity of every row (deleted rows included) to the query."""
+        query = _unit_vector(query_embedding)
+        return np.concatenate([part @ query for part in self._parts()] or [np.empty(0, dtype=np.float32)])
+
+    def _ivf_candidates(self, query, nprobe=None):
+        """Scores the rows of the probed IVF lists plus every row added since loading."""
+        rows, scores = [], []
+        for start, stop in self._ivf.probe(query, nprobe):
+            rows.append(np.arange(start, stop))
+            scores.append(np.asarray(self._matrix[start:stop]) @ query)
+        offset = len(self._matrix)
+        for part in self._added_parts():
+            rows.append(np.arange(offset, offset + len(part)))
+            scores.append(np.asarray(part) @ query)
+            offset += len(part)
+        return np.concatenate(rows), np.concatenate(scores)
+
+    def row_ids(self, rows):
+        return [self._node_ids[row] for row in rows]
+
+    def query(self, query, **kwargs):
+        if query.filters is not None:
+            raise ValueError("NumpyVectorStore does not support metadata filters")
+        vector = _unit_vector(query.query_embedding)
+        if self._ivf is not None and not query.doc_ids and not query.node_ids:
+            rows, scores = self._ivf_candidates(vector, kwargs.get("nprobe"))
+            keep = self._alive[rows]
+        else:
+            scores = self.similarities(vector)
+            rows = np.arange(len(scores))
+            keep = self._alive.copy()
+            if query.doc_ids:
+                keep &= np.isin(np.asarray(self._ref_doc_ids, dtype=object), list(query.doc_ids))
+            if query.node_ids:
+                keep &= np.isin(np.asarray(self._node_ids, dtype=object), list(query.node_ids))
+        rows, scores = rows[keep], scores[keep]
+
+        top_k = min(query.similarity_top_k, len(rows))
+        if top_k <= 0:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return VectorStoreQueryResult(similarities=scores[top].tolist(), ids=self.row_ids(rows[top]))
+
+    def persist(self, persist_path, fs=None):
+        """Writes the live rows to ``.npy`` in chunks and the IDs to the side file.
+
+        Large stores are written grouped by IVF list, with the centroids and
+        list offsets saved next to the matrix. The store then switches to the
+        memory-mapped copy, so the rows leave RAM and an index that was just
+        built searches through its IVF lists too.
+        """
+        matrix_path, meta_path, ivf_path = _paths(persist_path)
+        os.makedirs(os.path.dirname(matrix_path) or ".", exist_ok=True)
+        alive = np.flatnonzero(self._alive)
+        temp_path = matrix_path + ".tmp"
+
+        if len(alive):
+            out = np.lib.format.open_memmap(temp_path, mode="w+", dtype=np.float32, shape=(len(alive), self.dim))
+            written, offset = 0, 0
+            for part in self._parts():
+                rows = alive[(alive >= offset) & (alive < offset + len(part))] - offset
+                for start in range(0, len(rows), COPY_ROWS):
+                    chunk = part[rows[start:start + COPY_ROWS]]
+                    out[written:written + len(chunk)] = chunk
+                    written += len(chunk)
+                offset += len(part)
+            out.flush()
+            del out
+        else:
+            with open(temp_path, "wb") as handle:
+                np.save(handle, np.zeros((0, self.dim), dtype=np.float32))
+
+        ivf = None
+        if len(alive) >= config.ANN_MIN_ROWS:
+            ivf, order = self._write_ivf_order(temp_path)
+            alive = alive[order]
+        os.replace(temp_path, matrix_path)
+        if ivf is not None:
+            ivf.save(ivf_path)
+        elif os.path.exists(ivf_path):
+            os.remove(ivf_path)
+
+        meta = {
+            "dim": self.dim,
+            "node_ids": [self._node_ids[row] for row in alive],
+            "ref_doc_ids": [self._ref_doc_ids[row] for row in alive],
+        }
+        with open(meta_path, "w", encoding="utf-8") as handle:
+            json.dump(meta, handle)
+        matrix = np.load(matrix_path, mmap_mode="r") if len(alive) else None
+        self._reset(matrix, meta["node_ids"], meta["ref_doc_ids"], ivf)
+
+    @staticmethod
+    def _write_ivf_order(matrix_path):
+        """Builds an IVF index over a persisted matrix and rewrites it grouped by list."""
+        rows = np.load(matrix_path, mmap_mode="r")
+        ivf, order = IVFIndex.build(rows)
+        grouped_path = matrix_path + ".ivf"
+        out = np.lib.format.open_memmap(grouped_path, mode="w+", dtype=np.float32, shape=rows.shape)
+        for start in range(0, len(order), COPY_ROWS):
+            out[start:start + COPY_ROWS] = rows[order[start:start + COPY_ROWS]]
+        out.flush()
+        del out, rows
+        os.replace(grouped_path, matrix_path)
+        return ivf, order
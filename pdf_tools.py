@@ -0,0 +1,58 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from PyPDF2 import PdfReader, PdfWriter
+
+import config
+from cache_eviction import MERGED_DIR, prune_cache, touch
+from index_cache import file_digest
+from tracing import record_cache, span
+
+
+def merge_key(files):
+    """Hashes the uploaded file bytes in upload order, since page order depends on it."""
+    payload = "\n".join(file_digest(file) for file in files)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def merged_pdf_path(files):
+    """Returns where the merged PDF for ``files`` is (or would be) cached."""
+    return Path(config.CACHE_ROOT) / MERGED_DIR / f"{merge_key(files)}.pdf"
+
+
+def merged_pdf(files):
+    """Merges the uploaded PDFs into one file, once per content hash, and returns its path."""
+    with span("merge_pdfs", files=len(files)):
+        target = merged_pdf_path(files)
+        if target.exists():
+            record_cache("merged_pdf", "hit")
+            touch(target)
+            return target
+        record_cache("merged_pdf", "miss")
+        _write_merged_pdf(files, target)
+        prune_cache()
+        return target
+
+
+def _write_merged_pdf(files, target):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    pdf_writer = PdfWriter()
+    for uploaded_file in files:
+        # PdfReader reads the upload in place instead of a getvalue() copy
+        if not isinstance(uploaded_file, (str, os.PathLike)):
+            uploaded_file.seek(0)
+        reader = PdfReader(uploaded_file)
+        for page in reader.pages:
+            pdf_writer.add_page(page)
+
+    fd, temp_path = tempfile.mkstemp(dir=target.parent, suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            pdf_writer.write(handle)
+        os.replace(temp_path, target)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return target
@@ -0,0 +1,91 @@
+import json
+import logging
+import os
+import threading
+import time
+
+import config
+from index_cache import cache_dir
+from tracing import span
+
+SUMMARY_NAME = "summary.json"
+SUMMARY_PROMPT = "Summarize briefly"
+
+logger = logging.getLogger(__name__)
+
+_running = {}
+_failures = {}  # corpus key -> (failed at, error message)
+_running_lock = threading.Lock()
+
+
+def load_summary(key):
+    """Returns the cached summary for a corpus, or None if it has not been generated."""
+    summary_path = cache_dir(key) / SUMMARY_NAME
+    if not summary_path.exists():
+        return None
+    with open(summary_path, "r", encoding="utf-8") as handle:
+        return json.load(handle)["summary"]
+
+
+def save_summary(key, summary):
+    """Stores a corpus summary next to its persisted index."""
+    summary_path = cache_dir(key) / SUMMARY_NAME
+    temp_path = summary_path.with_suffix(".tmp")
+    with open(temp_path, "w", encoding="utf-8") as handle:
+        json.dump({"prompt": SUMMARY_PROMPT, "summary": summary}, handle)
+    os.replace(temp_path, summary_path)
+
+
+def generate_summary(index, key):
+    """Summarises the corpus with a one-off query engine and caches the result.
+
+    A query engine is used instead of the session's chat engine so the
+    summary never lands in a user's chat history.
+    """
+    with span("summary"):
+        response = index.as_query_engine().query(SUMMARY_PROMPT)
+    save_summary(key, response.response)
+    return response.response
+
+
+def ensure_summary(index, key, retry=False):
+    """Returns the cached summary, starting a background job to generate it if needed.
+
+    Returns None while the summary is still being generated, or after a
+    failure until SUMMARY_RETRY_SECONDS have passed or ``retry`` is set.
+    At most one job runs per corpus key, however many sessions ask for it.
+    """
+    summary = load_summary(key)
+    if summary is not None:
+        return summary
+
+    with _running_lock:
+        if key in _running and _running[key].is_alive():
+            return None
+        failure = _failures.get(key)
+        if failure is not None and not retry and time.time() - failure[0] < config.SUMMARY_RETRY_SECONDS:
+            return None
+        _failures.pop(key, None)
+        thread = threading.Thread(target=_run_summary, args=(index, key), name=f"summary-{key[:12]}", daemon=True)
+        _running[key] = thread
+        thread.start()
+    return None
+
+
+def summary_error(key):
+    """Returns why the last summary job for ``key`` failed, or None if it did not."""
+    with _running_lock:
+        failure = _failures.get(key)
+        return failure[1] if failure is not None else None
+
+
+def _run_summary(index, key):
+    try:
+        generate_summary(index, key)
+    except Exception as e:
+        logger.exception("Failed to summarise corpus %s", key)
+        with _running_lock:
+            _failures[key] = (time.time(), str(e))
+    finally:
+        with _running_lock:
+            _running.pop(key, None)
@@ -0,0 +1,316 @@
+import contextvars
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+
+from llama_index.core.callbacks import CallbackManager, CBEventType, EventPayload
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+
+import config
+
+TOKEN_ATTRIBUTES = ("prompt_tokens", "completion_tokens", "embedding_tokens")
+# Span records waiting for the log writer; beyond this they are dropped, not queued
+WRITE_QUEUE_SIZE = 10000
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_shared_tracer = None
+_shared_handler = None
+_shared_lock = threading.Lock()
+
+
+class Span:
+    """One timed step; numeric attributes such as token counts roll up into metrics."""
+
+    def __init__(self, name, parent=None, **attributes):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self.attributes = attributes
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def end(self):
+        if self.duration_ms is None:
+            self.duration_ms = (time.perf_counter() - self._started) * 1000
+            shared_tracer().finish(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "started_at": round(self.started_at, 6),
+            "duration_ms": round(self.duration_ms or 0.0, 3),
+            "attributes": self.attributes,
+        }
+
+
+class Tracer:
+    """Collects finished spans: a recent-span buffer, Prometheus metrics and an optional JSON lines log.
+
+    Metrics are aggregated per span name (duration sum and count, token
+    counters) and per cache (hits and misses by result). A background
+    thread appends spans to ``log_path``, rotating it at ``log_max_bytes``,
+    and rewrites the text exposition at ``metrics_path`` after root spans
+    end, so requests never wait on file I/O.
+    """
+
+    def __init__(self, buffer_size=None, log_path=None, metrics_path=None, log_max_bytes=None):
+        self.log_path = config.TRACE_LOG_PATH if log_path is None else log_path
+        self.metrics_path = config.METRICS_PATH if metrics_path is None else metrics_path
+        self.log_max_bytes = int(config.TRACE_LOG_MAX_MB * 1024 * 1024) if log_max_bytes is None else log_max_bytes
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._spans = deque(maxlen=buffer_size or config.TRACE_BUFFER_SIZE)
+        self._durations = defaultdict(lambda: [0.0, 0])  # span name -> [seconds, count]
+        self._tokens = defaultdict(int)  # (span name, kind) -> tokens
+        self._cache = defaultdict(int)  # (cache, result) -> events
+        self._writes = queue.Queue(maxsize=WRITE_QUEUE_SIZE)  # span records, or None for "rewrite metrics"
+        self._writer = None
+
+    def finish(self, span):
+        record = span.to_dict()
+        with self._lock:
+            self._spans.append(record)
+            totals = self._durations[span.name]
+            totals[0] += span.duration_ms / 1000
+            totals[1] += 1
+            for kind in TOKEN_ATTRIBUTES:
+                if span.attributes.get(kind):
+                    self._tokens[(span.name, kind)] += span.attributes[kind]
+        if self.log_path:
+            self._enqueue(record)
+        if span.parent_id is None and self.metrics_path:
+            self._enqueue(None)
+
+    def _enqueue(self, item):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+                self._writer.start()
+        try:
+            self._writes.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1  # Tracing must never slow down the request it measures
+
+    def flush(self):
+        """Waits until every queued span and metrics rewrite is on disk."""
+        if self._writer is not None:
+            self._writes.join()
+
+    def _write_loop(self):
+        while True:
+            items = [self._writes.get()]
+            while True:  # Drain what queued up meanwhile, so one open and one rewrite cover it
+                try:
+                    items.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                records = [item for item in items if item is not None]
+                if records:
+                    self._append_log(records)
+                if len(records) < len(items):
+                    self.write_metrics()
+            finally:
+                for _ in items:
+                    self._writes.task_done()
+
+    def _append_log(self, records):
+        try:
+            path = Path(self.log_path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if self.log_max_bytes > 0 and path.exists() and path.stat().st_size >= self.log_max_bytes:
+                os.replace(path, f"{path}.1")
+            with open(path, "a", encoding="utf-8") as handle:
+                handle.writelines(json.dumps(record, default=str) + "\n" for record in records)
+        except OSError:
+            pass  # Tracing must never break the app it measures
+
+    def count_cache(self, cache, result, count=1):
+        with self._lock:
+            self._cache[(cache, result)] += count
+
+    def recent(self, limit=None):
+        with self._lock:
+            spans = list(self._spans)
+        return spans[-limit:] if limit else spans
+
+    def trace(self, trace_id):
+        """Returns the buffered spans of one trace, in start order."""
+        return sorted((span for span in self.recent() if span["trace_id"] == trace_id), key=lambda span: span["started_at"])
+
+    def render_prometheus(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            durations = dict(self._durations)
+            tokens = dict(self._tokens)
+            cache = dict(self._cache)
+        lines = [
+            "# HELP rag_span_duration_seconds Time spent per pipeline step.",
+            "# TYPE rag_span_duration_seconds summary",
+        ]
+        for name, (seconds, count) in sorted(durations.items()):
+            lines.append(f'rag_span_duration_seconds_sum{{span="{name}"}} {seconds:.6f}')
+            lines.append(f'rag_span_duration_seconds_count{{span="{name}"}} {count}')
+        lines += ["# HELP rag_tokens_total Tokens consumed per pipeline step.", "# TYPE rag_tokens_total counter"]
+        for (name, kind), value in sorted(tokens.items()):
+            lines.append(f'rag_tokens_total{{span="{name}",kind="{kind.rsplit("_", 1)[0]}"}} {value}')
+        lines += ["# HELP rag_cache_requests_total Cache lookups by result.", "# TYPE rag_cache_requests_total counter"]
+        for (name, result), value in sorted(cache.items()):
+            lines.append(f'rag_cache_requests_total{{cache="{name}",result="{result}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self):
+        try:
+            path = Path(self.metrics_path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=path.parent, prefix=".metrics-")
+            with os.fdopen(handle, "w", encoding="utf-8") as out:
+                out.write(self.render_prometheus())
+            os.replace(temp_path, path)
+        except OSError:
+            pass
+
+
+def shared_tracer():
+    """Returns the process-wide tracer."""
+    global _shared_tracer
+    with _shared_lock:
+        if _shared_tracer is None:
+            _shared_tracer = Tracer()
+        return _shared_tracer
+
+
+def current_span():
+    return _current_span.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """Times the enclosed block as a child of the current span; yields the Span (None if tracing is off)."""
+    if not config.TRACE_ENABLED:
+        yield None
+        return
+    current = Span(name, _current_span.get(), **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def record_cache(cache, result, count=1):
+    """Counts a cache lookup result and notes it on the current span."""
+    if not config.TRACE_ENABLED or count <= 0:
+        return
+    shared_tracer().count_cache(cache, result, count)
+    current = _current_span.get()
+    if current is not None:
+        current.add(**{f"{cache}_cache_{result}": count})
+
+
+def _estimate_tokens(text):
+    from embeddings import estimate_tokens
+
+    return estimate_tokens(text) if text else 0
+
+
+def _usage(response):
+    raw = getattr(response, "raw", None)
+    usage = raw.get("usage") if isinstance(raw, dict) else getattr(raw, "usage", None)
+    if usage is None:
+        return None, None
+    if isinstance(usage, dict):
+        return usage.get("prompt_tokens"), usage.get("completion_tokens")
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+
+
+def _handler():
+    global _shared_handler
+    with _shared_lock:
+        if _shared_handler is None:
+            _shared_handler = SpanCallbackHandler()
+        return _shared_handler
+
+
+def callback_manager():
+    """Returns a llama_index CallbackManager that reports events as spans, or None if tracing is off."""
+    if not config.TRACE_ENABLED:
+        return None
+    return CallbackManager([_handler()])
+
+
+class SpanCallbackHandler(BaseCallbackHandler):
+    """Turns llama_index callback events (LLM calls, retrieval, synthesis, embedding) into spans.
+
+    Events nest under their llama_index parent event, or else under the span
+    that was current when they started, so a chat turn shows the question
+    condensation LLM call, retrieval and the answer LLM call as separate
+    children with their token counts.
+    """
+
+    def __init__(self):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self._open = {}
+        self._lock = threading.Lock()
+
+    def on_event_start(self, event_type, payload=None, event_id="", parent_id="", **kwargs):
+        if not config.TRACE_ENABLED:
+            return event_id
+        with self._lock:
+            parent = self._open.get(parent_id) or _current_span.get()
+            event_span = self._open[event_id] = Span(event_type.value, parent)
+        payload = payload or {}
+        if event_type == CBEventType.LLM:
+            messages = payload.get(EventPayload.MESSAGES)
+            prompt = "\n".join(str(message.content) for message in messages) if messages else payload.get(EventPayload.PROMPT)
+            event_span.set(prompt_tokens=_estimate_tokens(prompt or ""), tokens_estimated=True)
+        return event_id
+
+    def on_event_end(self, event_type, payload=None, event_id="", **kwargs):
+        with self._lock:
+            event_span = self._open.pop(event_id, None)
+        if event_span is None:
+            return
+        payload = payload or {}
+        if event_type == CBEventType.LLM:
+            response = payload.get(EventPayload.RESPONSE) or payload.get(EventPayload.COMPLETION)
+            prompt_tokens, completion_tokens = _usage(response)
+            if prompt_tokens is not None:
+                event_span.set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens or 0, tokens_estimated=False)
+            else:
+                text = getattr(getattr(response, "message", None), "content", None) or getattr(response, "text", None)
+                event_span.set(completion_tokens=_estimate_tokens(text or ""))
+        elif event_type == CBEventType.EMBEDDING:
+            chunks = payload.get(EventPayload.CHUNKS) or []
+            event_span.set(embedding_tokens=sum(_estimate_tokens(chunk) for chunk in chunks), chunks=len(chunks))
+        elif event_type == CBEventType.RETRIEVE:
+            event_span.set(nodes=len(payload.get(EventPayload.NODES) or []))
+        event_span.end()
+
+    def start_trace(self, trace_id=None):
+        pass
+
+    def end_trace(self, trace_id=None, trace_map=None):
+        pass
@@ -0,0 +1,145 @@
+import argparse
+import importlib
+import logging
+import sys
+import threading
+import time
+
+import config
+
+# Imported in this order so each one's time excludes what earlier ones pulled in
+HEAVY_MODULES = (
+    "openai",
+    "llama_index.core",
+    "llama_index.llms.openai",
+    "pdfplumber",
+    "PyPDF2",
+    "index_cache",
+    "hybrid_retrieval",
+    "chat_ui",
+)
+
+logger = logging.getLogger(__name__)
+
+_resources = {}
+_resource_locks = {}
+_shared_warmup = None
+_shared_lock = threading.Lock()
+
+
+def shared_resource(name, factory):
+    """Returns the process-wide object ``name``, building it with ``factory`` on first use.
+
+    Concurrent callers wait for a single build, so an app asking for a
+    client that the warm-up thread is still creating gets that same one.
+    """
+    with _shared_lock:
+        if name in _resources:
+            return _resources[name]
+        lock = _resource_locks.setdefault(name, threading.Lock())
+    with lock:
+        if name not in _resources:
+            _resources[name] = factory()
+        return _resources[name]
+
+
+def timed_import(name, timings):
+    """Imports a module, recording its import time in ``timings`` unless it was already loaded."""
+    if name in sys.modules:
+        return sys.modules[name]
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    timings.append((f"import {name}", time.perf_counter() - started))
+    return module
+
+
+class Warmup:
+    """Background start-up work: heavy imports, then the clients and tokenizer.
+
+    ``timings`` lists ``(step, seconds)`` in completion order; ``report``
+    formats them for logs and the apps' timing panel.
+    """
+
+    def __init__(self, resources=None, modules=HEAVY_MODULES):
+        self.resources = dict(resources or {})
+        self.modules = modules
+        self.timings = []
+        self.errors = []
+        self.started_at = time.time()
+        self.done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def _step(self, name, function):
+        started = time.perf_counter()
+        try:
+            function()
+        except Exception as e:  # Warm-up is best effort; the real call will raise properly
+            self.errors.append(f"{name}: {e}")
+            return
+        self.timings.append((name, time.perf_counter() - started))
+
+    def _run(self):
+        try:
+            for module in self.modules:
+                try:
+                    timed_import(module, self.timings)
+                except ImportError as e:
+                    self.errors.append(f"import {module}: {e}")
+
+            from context_budget import count_tokens
+            from embeddings import shared_embed_model
+
+            self._step("tokenizer", lambda: count_tokens("warm up"))
+            self._step("embedding client", shared_embed_model)
+            for name, factory in self.resources.items():
+                self._step(name, lambda: shared_resource(name, factory))
+        finally:
+            self.done.set()
+            logger.info("Warm-up finished:\n%s", self.report())
+
+    def report(self):
+        rows = [f"{name:<36}{seconds * 1000:>10.1f} ms" for name, seconds in self.timings]
+        rows += [f"failed: {error}" for error in self.errors]
+        return "\n".join(rows)
+
+
+def start_warmup(resources=None):
+    """Starts the process-wide warm-up once and returns it; later calls return the same one.
+
+    ``resources`` maps names to factories for app objects worth building
+    ahead of the first request, such as the LLM service context; the app
+    fetches them with ``shared_resource`` under the same name.
+    """
+    global _shared_warmup
+    if not config.WARMUP_ENABLED:
+        return None
+    with _shared_lock:
+        if _shared_warmup is None:
+            _shared_warmup = Warmup(resources).start()
+        return _shared_warmup
+
+
+def shared_warmup():
+    return _shared_warmup
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the start-up imports and client set-up.")
+    parser.add_argument("--modules", nargs="*", default=HEAVY_MODULES, help="modules to import, in order")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    warmup = Warmup(modules=args.modules).start()
+    warmup.wait()
+    print(warmup.report())
+    print(f"{'total':<36}{(time.perf_counter() - started) * 1000:>10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()